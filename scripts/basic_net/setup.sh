@@ -35,36 +35,38 @@ server_ip=${2:-$DEFAULT_SERVER_IP}
 
 
 ## SETUP ##
-# create bridge
-ip link add br0 type bridge
-ip link set br0 up
+# everything in the root namespace goes through one `ip -batch`,
+# rather than forking ip for every single command
+ip -batch - <<EOF
+link add br0 type bridge
+link set br0 up
 
-# create namespaces
-ip netns add nsc
-ip netns add nss
+netns add nsc
+netns add nss
 
-# create veth pairs
-ip link add veth-c type veth peer name veth-brc
-ip link add veth-s type veth peer name veth-brs
+link add veth-c type veth peer name veth-brc
+link add veth-s type veth peer name veth-brs
+
+link set veth-c netns nsc
+link set veth-brc master br0
+link set veth-brc up
+
+link set veth-s netns nss
+link set veth-brs master br0
+link set veth-brs up
+EOF
 
 ## CONFIGURE ##
-# connect client veth pair
-ip link set veth-c netns nsc
-ip link set veth-brc master br0
-
-# set up client the veth pair
-ip netns exec nsc ip address add $client_ip dev veth-c
-ip netns exec nsc ip link set veth-c up
-ip link set veth-brc up
-
-# connect server veth pair
-ip link set veth-s netns nss
-ip link set veth-brs master br0
-
-# set up server the veth pair
-ip netns exec nss ip address add $server_ip dev veth-s
-ip netns exec nss ip link set veth-s up
-ip link set veth-brs up
+# then one batch inside each namespace, to set up its end of the veth pair
+ip -n nsc -batch - <<EOF
+address add $client_ip dev veth-c
+link set veth-c up
+EOF
+
+ip -n nss -batch - <<EOF
+address add $server_ip dev veth-s
+link set veth-s up
+EOF
 
 ## TAP ##
 
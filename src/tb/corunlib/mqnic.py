@@ -9,6 +9,10 @@ from cocotbext.axi.address_space import Pool
 
 # module imports
 import datetime
+import heapq
+import json
+import os
+from pathlib import Path
 from collections import deque
 
 import cocotb
@@ -20,6 +24,21 @@ from cocotbext.axi import Window
 
 import struct
 
+# Hot-path tracing, for the per-event and per-entry logs that would otherwise
+# dominate wall time on anything bigger than a single packet.
+# Off by default, set MQNIC_TRACE (or call set_trace_level) to turn it on:
+MQNIC_TRACE_OFF     = 0  # no per-event/per-entry logs at all
+MQNIC_TRACE_EVENTS  = 1  # one line per interrupt/EQ/CQ pass
+MQNIC_TRACE_ENTRIES = 2  # one line per event/completion/packet, too
+
+trace_level = int(os.environ.get("MQNIC_TRACE", MQNIC_TRACE_OFF))
+
+
+def set_trace_level(level):
+    global trace_level
+    trace_level = level
+
+
 MQNIC_MAX_EQ   = 1
 MQNIC_MAX_TXQ  = 32
 MQNIC_MAX_RXQ  = 8
@@ -357,6 +376,10 @@ MQNIC_DESC_SIZE = 16
 MQNIC_CPL_SIZE = 32
 MQNIC_EVENT_SIZE = 32
 
+# precompiled entry layouts, so the CQ/EQ hot paths don't re-parse the format
+MQNIC_CPL_STRUCT = struct.Struct("<HHHxxLHHLBBHLL")
+MQNIC_EVENT_STRUCT = struct.Struct("<HHLLLLLLL")
+
 
 class Resource:
     def __init__(self, count, parent, stride):
@@ -365,14 +388,24 @@ class Resource:
         self.stride = stride
 
         self.windows = {}
+        # min-heap, so the lowest free index is always handed out first
+        # (a sorted range is already a valid heap)
         self.free_list = list(range(count))
 
     def alloc(self):
-        return self.free_list.pop(0)
+        return heapq.heappop(self.free_list)
+
+    def alloc_many(self, n):
+        if n > len(self.free_list):
+            raise IndexError("Not enough free resources")
+        return [heapq.heappop(self.free_list) for k in range(n)]
 
     def free(self, index):
-        self.free_list.append(index)
-        self.free_list.sort()
+        heapq.heappush(self.free_list, index)
+
+    def free_many(self, indices):
+        for index in indices:
+            heapq.heappush(self.free_list, index)
 
     def get_count(self):
         return self.count
@@ -383,6 +416,63 @@ class Resource:
         return self.windows[index]
 
 
+class PostedWrites:
+    """Batches up dword register writes, without awaiting each one
+
+    Writes are queued and issued strictly in order, each as its own
+    single-dword TLP (BAR0 sits behind pcie_axil_master, which can't take
+    anything wider), by one background task, so the caller never awaits a
+    write. Leaving the batch waits for that task to drain, then fences with
+    a single read, which can't pass the posted writes ahead of it.
+
+    Usage:
+        async with rb.batch() as regs:
+            regs.write_dword(REG_A, 1)
+            regs.write_dwords(REG_TABLE, values)
+    """
+    def __init__(self, window, fence=True):
+        self.window = window
+        self.fence = fence
+
+        self._queue = deque()
+        self._task = None
+
+    def write_dword(self, addr, data, window=None):
+        self._queue.append((window or self.window, addr, data))
+        if self._task is None:
+            self._task = cocotb.start_soon(self._issue())
+
+    def write_dwords(self, addr, values, window=None):
+        """one single-dword write per value, at consecutive addresses"""
+        for k, data in enumerate(values):
+            self.write_dword(addr + 4*k, data, window)
+
+    async def _issue(self):
+        while self._queue:
+            window, addr, data = self._queue.popleft()
+            await window.write_dword(addr, data)
+        self._task = None
+
+    async def flush(self):
+        """wait for every queued write to go out, then fence (if enabled)"""
+        while self._task is not None:
+            await self._task
+
+        if self.fence:
+            await self.window.read_dword(0)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.flush()
+        elif self._task is not None:
+            self._queue.clear()
+            self._task.kill()
+            self._task = None
+
+
 class RegBlock(Window):
     def __init__(self, parent, offset, size, base=0, **kwargs):
         super().__init__(parent, offset, size, base, **kwargs)
@@ -390,12 +480,43 @@ class RegBlock(Window):
         self.type = 0
         self.version = 0
 
+    def batch(self, fence=True):
+        """see PostedWrites"""
+        return PostedWrites(self, fence)
+
 
 class RegBlockList:
     def __init__(self):
         self.blocks = []
 
-    async def enumerate_reg_blocks(self, window, offset=0):
+        # find() indexes: (type, version) -> blocks, and type -> blocks,
+        # both in enumeration order
+        self._by_type_version = {}
+        self._by_type = {}
+
+    def _add(self, rb):
+        self.blocks.append(rb)
+        self._by_type_version.setdefault((rb.type, rb.version), []).append(rb)
+        self._by_type.setdefault(rb.type, []).append(rb)
+
+    async def enumerate_reg_blocks(self, window, offset=0, cache=None):
+        """walk the register block chain starting at `offset` in `window`
+
+        if a RegBlockCache is given, a previously recorded chain for the
+        same start address is used instead of reading it out of the device,
+        and a freshly enumerated one is recorded for next time
+        """
+        base = window.get_absolute_address(offset)
+
+        if cache is not None:
+            layout = cache.get(base)
+            if layout is not None:
+                self.load(window, layout)
+                return
+
+        start = len(self.blocks)
+        seen = {block.offset for block in self.blocks}
+
         while True:
             rb_type = await window.read_dword(offset+MQNIC_RB_REG_TYPE)
             rb_version = await window.read_dword(offset+MQNIC_RB_REG_VER)
@@ -403,21 +524,38 @@ class RegBlockList:
             rb.type = rb_type
             rb.version = rb_version
             print(f"Block ID {rb_type:#010x} version {rb_version:#010x} at offset {offset:#010x}")
-            self.blocks.append(rb)
+            self._add(rb)
+            seen.add(offset)
             offset = await window.read_dword(offset+MQNIC_RB_REG_NEXT_PTR)
             if offset == 0:
-                return
+                break
             assert offset & 0x3 == 0, "Register block not aligned"
-            for block in self.blocks:
-                assert block.offset != offset, "Register blocks form a loop"
+            assert offset not in seen, "Register blocks form a loop"
+
+        if cache is not None:
+            cache.put(base, self.snapshot(start))
+
+    def load(self, window, layout):
+        """recreate blocks from a `snapshot`, without touching the device"""
+        for offset, rb_type, rb_version in layout:
+            rb = window.create_window(offset, window_type=RegBlock)
+            rb.type = rb_type
+            rb.version = rb_version
+            self._add(rb)
+
+    def snapshot(self, start=0):
+        """(offset, type, version) of every block, for `load`"""
+        return [[rb.offset, rb.type, rb.version] for rb in self.blocks[start:]]
 
     def find(self, rb_type, version=None, index=0):
-        for block in self.blocks:
-            if block.type == rb_type and (not version or block.version == version):
-                if index <= 0:
-                    return block
-                else:
-                    index -= 1
+        if version:
+            blocks = self._by_type_version.get((rb_type, version))
+        else:
+            blocks = self._by_type.get(rb_type)
+
+        index = max(index, 0)
+        if blocks and index < len(blocks):
+            return blocks[index]
         return None
 
     def __getitem__(self, key):
@@ -427,17 +565,262 @@ class RegBlockList:
         return len(self.blocks)
 
 
+class RegBlockCache:
+    """Enumerated register maps, saved to disk per bitstream
+
+    Maps are keyed on FW ID and git hash, then on the absolute address each
+    chain starts at; `validate` picks the map for the bitstream that's
+    actually loaded, with (typically) a single register read.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.maps = {}
+        self.key = None
+        self.dirty = False
+
+        # chains enumerated before we knew which bitstream they belong to
+        self._pending = {}
+
+        if self.path.exists():
+            with open(self.path) as f:
+                self.maps = json.load(f).get("maps", {})
+
+    @staticmethod
+    def make_key(fw_id, git_hash):
+        return f"{fw_id:08x}-{git_hash:08x}"
+
+    async def validate(self, window):
+        """select the cached map matching the device behind `window`, if any
+
+        Returns
+        -------
+        bool
+            whether a matching map was found
+        """
+        base = f"{window.get_absolute_address(0):x}"
+        git_hashes = {}
+
+        for key, chains in self.maps.items():
+            for offset, rb_type, rb_version in chains.get(base, ()):
+                if rb_type == MQNIC_RB_FW_ID_TYPE and rb_version == MQNIC_RB_FW_ID_VER:
+                    break
+            else:
+                continue
+
+            addr = offset + MQNIC_RB_FW_ID_REG_GIT_HASH
+            if addr + 4 > window.size:
+                continue
+            if addr not in git_hashes:
+                git_hashes[addr] = await window.read_dword(addr)
+
+            if key.endswith(f"-{git_hashes[addr]:08x}"):
+                self.key = key
+                return True
+
+        return False
+
+    def bind(self, fw_id, git_hash):
+        """tell the cache which bitstream we're on, once the IDs have been read"""
+        key = self.make_key(fw_id, git_hash)
+
+        if self.key is not None and self.key != key:
+            raise ValueError(
+                f"Register map cache entry {self.key} doesn't match the "
+                f"loaded bitstream ({key}), delete {self.path} and rerun"
+            )
+
+        self.key = key
+        if self._pending:
+            self.maps.setdefault(key, {}).update(self._pending)
+            self._pending = {}
+            self.dirty = True
+
+    def get(self, base):
+        if self.key is None:
+            return None
+        return self.maps.get(self.key, {}).get(f"{base:x}")
+
+    def put(self, base, layout):
+        if self.key is None:
+            self._pending[f"{base:x}"] = layout
+        else:
+            self.maps.setdefault(self.key, {})[f"{base:x}"] = layout
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"maps": self.maps}, f, indent=1)
+        tmp.replace(self.path)
+
+        self.dirty = False
+
+
+class PacketBuffer:
+    """A fixed-size packet buffer, carved out of a PacketSlab chunk
+
+    Quacks enough like a MemoryRegion (slicing, `size`,
+    `get_absolute_address`) for the rings to use it as a DMA buffer.
+    """
+    def __init__(self, slab: PacketSlab, index, region, offset, size):
+        self.slab = slab
+        self.index = index
+        self.region = region
+        self.offset = offset
+        self.size = size
+
+    def get_absolute_address(self, address):
+        return self.region.get_absolute_address(self.offset+address)
+
+    def _translate(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.size)
+            return slice(self.offset+start, self.offset+stop, step)
+        if key < 0:
+            key += self.size
+        if not 0 <= key < self.size:
+            raise IndexError("packet buffer index out of range")
+        return self.offset+key
+
+    def __getitem__(self, key):
+        return self.region.mem[self._translate(key)]
+
+    def __setitem__(self, key, value):
+        self.region.mem[self._translate(key)] = value
+
+    def __len__(self):
+        return self.size
+
+    def view(self, start=0, stop=None):
+        """zero-copy memoryview over (part of) this buffer"""
+        start, stop, _ = slice(start, stop).indices(self.size)
+        return memoryview(self.region.mem)[self.offset+start:self.offset+stop]
+
+
+class PacketSlab:
+    """Slab allocator for packet buffers
+
+    Buffers are carved out of large, pre-reserved Pool regions (chunks),
+    and are tracked by index: a free-index stack plus an in-use map,
+    so both alloc and free are O(1), as is double-free detection.
+    If the slab runs dry, another chunk is reserved.
+    """
+    def __init__(self, pool: Pool, buf_size, count):
+        self.pool = pool
+        self.buf_size = buf_size
+        self.chunk_count = count
+
+        self.regions = []
+        self.buffers: list[PacketBuffer] = []
+        self.free_list = []
+        self.in_use = bytearray()
+
+        self.outstanding = 0
+        self.peak = 0
+
+        self._grow()
+
+    def _grow(self):
+        region = self.pool.alloc_region(self.buf_size*self.chunk_count)
+        self.regions.append(region)
+
+        base = len(self.buffers)
+        for k in range(self.chunk_count):
+            self.buffers.append(PacketBuffer(self, base+k, region, k*self.buf_size, self.buf_size))
+        self.in_use.extend(bytes(self.chunk_count))
+
+        # pop from the end, so hand out the lowest indices first
+        self.free_list.extend(range(base+self.chunk_count-1, base-1, -1))
+
+    def alloc(self) -> PacketBuffer:
+        if not self.free_list:
+            self._grow()
+
+        index = self.free_list.pop()
+        self.in_use[index] = 1
+
+        self.outstanding += 1
+        if self.outstanding > self.peak:
+            self.peak = self.outstanding
+
+        return self.buffers[index]
+
+    def free(self, buf: PacketBuffer):
+        assert buf.slab is self, "Packet buffer not from this slab"
+        assert self.in_use[buf.index], "Packet buffer double free"
+
+        self.in_use[buf.index] = 0
+        self.free_list.append(buf.index)
+
+        self.outstanding -= 1
+
+    def get_capacity(self):
+        return len(self.buffers)
+
+    def get_stats(self):
+        return {
+            'capacity': self.get_capacity(),
+            'outstanding': self.outstanding,
+            'peak': self.peak,
+            'chunks': len(self.regions),
+        }
+
+
 class Packet:
-    def __init__(self, data=b''):
+    def __init__(self, data=b'', buf: PacketBuffer | None = None, free=None):
         self.data = data
         self.queue = None
         self.timestamp_s = None
         self.timestamp_ns = None
         self.rx_checksum = None
 
+        # set when data is a zero-copy view over this (driver-owned) buffer,
+        # along with how to give it back (i.e. Driver.free_pkt)
+        assert buf is None or free is not None, "zero-copy Packet needs a free callback"
+        self.buf = buf
+        self._free = free
+
+    def release(self):
+        """hand a zero-copy packet's buffer back to the driver (via free_pkt)
+
+        the data view is invalidated, so copy anything you want to keep first;
+        this is a no-op for packets that own (a copy of) their data
+        """
+        if self.buf is None:
+            return
+
+        if isinstance(self.data, memoryview):
+            self.data.release()
+        self.data = b''
+
+        self._free(self.buf)
+        self.buf = None
+
+    def detach(self):
+        """copy a zero-copy packet's data out, then give its buffer back
+
+        for packets that need to outlive their buffer; no-op otherwise
+        """
+        if self.buf is None:
+            return
+
+        data = bytes(self.data)
+        self.release()
+        self.data = data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
     def __repr__(self):
+        data = bytes(self.data) if isinstance(self.data, memoryview) else self.data
         return (
-            f'{type(self).__name__}(data={self.data}, '
+            f'{type(self).__name__}(data={data}, '
             f'queue={self.queue}, '
             f'timestamp_s={self.timestamp_s}, '
             f'timestamp_ns={self.timestamp_ns}, '
@@ -504,6 +887,7 @@ class Eq:
         self.cons_ptr = 0
 
         self.irq = irq
+        self.driver.irq_eqs.setdefault(irq, []).append(self)
 
         self.cq_table = {}
 
@@ -528,6 +912,7 @@ class Eq:
 
         # TODO free buffer
 
+        self.driver.irq_eqs[self.irq].remove(self)
         self.irq = None
 
         self.enabled = False
@@ -560,24 +945,29 @@ class Eq:
         if not self.interface.port_up:
             return
 
-        self.log.info("Process EQ")
+        if trace_level >= MQNIC_TRACE_EVENTS:
+            self.log.info("Process EQ")
 
         eq_cons_ptr = self.cons_ptr
         eq_index = eq_cons_ptr & self.size_mask
 
         while True:
-            event_data = struct.unpack_from("<HHLLLLLLL", self.buf, eq_index*self.stride)
+            event_data = MQNIC_EVENT_STRUCT.unpack_from(self.buf, eq_index*self.stride)
 
-            self.log.info("EQ %d index %d data: %s", self.eqn, eq_index, repr(event_data))
+            if trace_level >= MQNIC_TRACE_ENTRIES:
+                self.log.info("EQ %d index %d data: %r", self.eqn, eq_index, event_data)
 
             if bool(event_data[-1] & 0x80000000) == bool(eq_cons_ptr & self.size):
-                self.log.info("EQ %d empty", self.eqn)
+                if trace_level >= MQNIC_TRACE_EVENTS:
+                    self.log.info("EQ %d empty", self.eqn)
                 break
 
+            self.driver.event_count += 1
+
             if event_data[0] == MQNIC_EVENT_TYPE_CPL:
                 # completion
                 cq = self.cq_table[event_data[1]]
-                await cq.handler(cq)
+                self.driver.cpl_count += await cq.handler(cq)
                 await cq.arm()
 
             eq_cons_ptr += 1
@@ -586,6 +976,53 @@ class Eq:
         self.cons_ptr = eq_cons_ptr
         await self.write_cons_ptr()
 
+    async def poll_events(self, budget, pending):
+        """NAPI-style EQ pass: collects CQs with work, but doesn't handle them
+
+        Parameters
+        ----------
+        budget: int
+            the maximum number of events to consume in this pass
+
+        pending: dict[Cq, None]
+            CQs that have signalled completions get added to this
+            (it's a dict, so each CQ only appears once, in event order)
+
+        Returns
+        -------
+        int
+            the number of events consumed
+        """
+        if not self.interface.port_up:
+            return 0
+
+        eq_cons_ptr = self.cons_ptr
+        eq_index = eq_cons_ptr & self.size_mask
+        count = 0
+
+        while count < budget:
+            event_data = MQNIC_EVENT_STRUCT.unpack_from(self.buf, eq_index*self.stride)
+
+            if trace_level >= MQNIC_TRACE_ENTRIES:
+                self.log.info("EQ %d index %d data: %r", self.eqn, eq_index, event_data)
+
+            if bool(event_data[-1] & 0x80000000) == bool(eq_cons_ptr & self.size):
+                break
+
+            if event_data[0] == MQNIC_EVENT_TYPE_CPL:
+                pending[self.cq_table[event_data[1]]] = None
+
+            count += 1
+            eq_cons_ptr += 1
+            eq_index = eq_cons_ptr & self.size_mask
+
+        if count:
+            self.driver.event_count += count
+            self.cons_ptr = eq_cons_ptr
+            await self.write_cons_ptr()
+
+        return count
+
 
 class Cq:
     def __init__(self, interface: Interface):
@@ -614,11 +1051,12 @@ class Cq:
 
         self.hw_regs = None
 
-    async def open(self, eq, size):
+    async def open(self, eq, size, cqn=None):
+        """cqn: an index already allocated from cq_res (see Interface.open)"""
         if self.hw_regs:
             raise Exception("Already open")
 
-        self.cqn = self.interface.cq_res.alloc()
+        self.cqn = self.interface.cq_res.alloc() if cqn is None else cqn
 
         self.log.info("Open CQ %d (interface %d)", self.cqn, self.interface.index)
 
@@ -653,7 +1091,8 @@ class Cq:
 
         self.enabled = True
 
-    async def close(self):
+    async def close(self, free_index=True):
+        """free_index=False leaves the cqn for the caller to free"""
         if not self.hw_regs:
             return
 
@@ -668,7 +1107,8 @@ class Cq:
 
         self.hw_regs = None
 
-        self.interface.cq_res.free(self.cqn)
+        if free_index:
+            self.interface.cq_res.free(self.cqn)
         self.cqn = None
 
     async def read_prod_ptr(self):
@@ -684,6 +1124,50 @@ class Cq:
 
         await self.hw_regs.write_dword(MQNIC_CQ_CTRL_STATUS_REG, MQNIC_CQ_CMD_SET_ARM | 1)
 
+    def read_cpls(self, budget=None):
+        """Bulk read of all new completions, starting from cons_ptr
+
+        Entries are unpacked straight out of the ring with a precompiled
+        struct, a contiguous run at a time (i.e. up to the wrap point),
+        stopping at the first entry whose phase bit says it's still stale.
+
+        Parameters
+        ----------
+        budget: int | None = None
+            the maximum number of completions to hand back,
+            by default, everything that's there (at most a full ring)
+
+        Returns
+        -------
+        cpls: list[tuple]
+            the unpacked completion entries, in ring order,
+            cons_ptr is NOT advanced, that's up to the caller
+        """
+        assert self.stride == MQNIC_CPL_STRUCT.size
+
+        limit = self.size if budget is None else min(budget, self.size)
+        cpls = []
+        cons_ptr = self.cons_ptr
+
+        buf = memoryview(self.buf)
+
+        while len(cpls) < limit:
+            index = cons_ptr & self.size_mask
+            count = min(self.size - index, limit - len(cpls))
+
+            # valid entries have their phase bit opposite to the lap bit
+            phase = not (cons_ptr & self.size)
+
+            run = buf[index*self.stride:(index+count)*self.stride]
+            for cpl in MQNIC_CPL_STRUCT.iter_unpack(run):
+                if bool(cpl[-1] & 0x80000000) != phase:
+                    return cpls
+                cpls.append(cpl)
+
+            cons_ptr += count
+
+        return cpls
+
 
 class Txq:
     def __init__(self, interface: Interface):
@@ -717,11 +1201,12 @@ class Txq:
 
         self.hw_regs = None
 
-    async def open(self, cq, size, desc_block_size):
+    async def open(self, cq, size, desc_block_size, index=None):
+        """index: one already allocated from txq_res (see Interface.open)"""
         if self.hw_regs:
             raise Exception("Already open")
 
-        self.index = self.interface.txq_res.alloc()
+        self.index = self.interface.txq_res.alloc() if index is None else index
 
         self.log.info("Open TXQ %d (interface %d)", self.index, self.interface.index)
 
@@ -757,7 +1242,8 @@ class Txq:
         await self.hw_regs.write_dword(MQNIC_QUEUE_CTRL_STATUS_REG, MQNIC_QUEUE_CMD_SET_PROD_PTR | (self.prod_ptr & MQNIC_QUEUE_PTR_MASK))
         await self.hw_regs.write_dword(MQNIC_QUEUE_CTRL_STATUS_REG, MQNIC_QUEUE_CMD_SET_CONS_PTR | (self.cons_ptr & MQNIC_QUEUE_PTR_MASK))
 
-    async def close(self):
+    async def close(self, free_index=True):
+        """free_index=False leaves the queue index for the caller to free"""
         if not self.hw_regs:
             return
 
@@ -773,7 +1259,8 @@ class Txq:
 
         self.hw_regs = None
 
-        self.interface.txq_res.free(self.index)
+        if free_index:
+            self.interface.txq_res.free(self.index)
         self.index = None
 
     async def enable(self):
@@ -817,38 +1304,27 @@ class Txq:
             self.cons_ptr += 1
 
     @staticmethod
-    async def process_tx_cq(cq: Cq):
+    async def process_tx_cq(cq: Cq, budget=None):
         interface = cq.interface
 
-        interface.log.info("Process CQ %d for TXQ %d (interface %d)", cq.cqn, cq.src_ring.index, interface.index)
+        if trace_level >= MQNIC_TRACE_EVENTS:
+            interface.log.info("Process CQ %d for TXQ %d (interface %d)", cq.cqn, cq.src_ring.index, interface.index)
 
         ring = cq.src_ring
 
         if not interface.port_up:
-            return
+            return 0
 
         # process completion queue
-        cq_cons_ptr = cq.cons_ptr
-        cq_index = cq_cons_ptr & cq.size_mask
-
-        while True:
-            cpl_data = struct.unpack_from("<HHHxxLHHLBBHLL", cq.buf, cq_index*cq.stride)
-            ring_index = cpl_data[1] & ring.size_mask
+        cpls = cq.read_cpls(budget)
 
-            interface.log.info("CQ %d index %d data: %s", cq.cqn, cq_index, repr(cpl_data))
-
-            if bool(cpl_data[-1] & 0x80000000) == bool(cq_cons_ptr & cq.size):
-                interface.log.info("CQ %d empty", cq.cqn)
-                break
+        if trace_level >= MQNIC_TRACE_EVENTS:
+            interface.log.info("CQ %d: %d completions", cq.cqn, len(cpls))
 
-            interface.log.info("Ring index: %d", ring_index)
+        for cpl_data in cpls:
+            ring.free_desc(cpl_data[1] & ring.size_mask)
 
-            ring.free_desc(ring_index)
-
-            cq_cons_ptr += 1
-            cq_index = cq_cons_ptr & cq.size_mask
-
-        cq.cons_ptr = cq_cons_ptr
+        cq.cons_ptr += len(cpls)
         await cq.write_cons_ptr()
 
         # process ring
@@ -866,6 +1342,8 @@ class Txq:
 
         ring.clean_event.set()
 
+        return len(cpls)
+
 
 class Rxq:
     def __init__(self, interface):
@@ -897,11 +1375,12 @@ class Rxq:
 
         self.hw_regs = None
 
-    async def open(self, cq, size, desc_block_size):
+    async def open(self, cq, size, desc_block_size, index=None):
+        """index: one already allocated from rxq_res (see Interface.open)"""
         if self.hw_regs:
             raise Exception("Already open")
 
-        self.index = self.interface.rxq_res.alloc()
+        self.index = self.interface.rxq_res.alloc() if index is None else index
 
         self.log.info("Open RXQ %d (interface %d)", self.index, self.interface.index)
 
@@ -939,7 +1418,8 @@ class Rxq:
 
         await self.refill_buffers()
 
-    async def close(self):
+    async def close(self, free_index=True):
+        """free_index=False leaves the queue index for the caller to free"""
         if not self.hw_regs:
             return
 
@@ -955,7 +1435,8 @@ class Rxq:
 
         self.hw_regs = None
 
-        self.interface.rxq_res.free(self.index)
+        if free_index:
+            self.interface.rxq_res.free(self.index)
         self.index = None
 
     async def enable(self):
@@ -1025,53 +1506,54 @@ class Rxq:
         await self.write_prod_ptr()
 
     @staticmethod
-    async def process_rx_cq(cq):
+    async def process_rx_cq(cq, budget=None):
         interface = cq.interface
 
-        interface.log.info("Process CQ %d for RXQ %d (interface %d)", cq.cqn, cq.src_ring.index, interface.index)
+        if trace_level >= MQNIC_TRACE_EVENTS:
+            interface.log.info("Process CQ %d for RXQ %d (interface %d)", cq.cqn, cq.src_ring.index, interface.index)
 
         ring = cq.src_ring
 
         if not interface.port_up:
-            return
+            return 0
 
         # process completion queue
-        cq_cons_ptr = cq.cons_ptr
-        cq_index = cq_cons_ptr & cq.size_mask
-
-        while True:
-            cpl_data = struct.unpack_from("<HHHxxLHHLBBHLL", cq.buf, cq_index*cq.stride)
-            ring_index = cpl_data[1] & ring.size_mask
-
-            interface.log.info("CQ %d index %d data: %s", cq.cqn, cq_index, repr(cpl_data))
+        cpls = cq.read_cpls(budget)
 
-            if bool(cpl_data[-1] & 0x80000000) == bool(cq_cons_ptr & cq.size):
-                interface.log.info("CQ %d empty", cq.cqn)
-                break
+        if trace_level >= MQNIC_TRACE_EVENTS:
+            interface.log.info("CQ %d: %d completions", cq.cqn, len(cpls))
 
-            interface.log.info("Ring index: %d", ring_index)
+        for cpl_data in cpls:
+            ring_index = cpl_data[1] & ring.size_mask
             pkt = ring.rx_info[ring_index]
 
             length = cpl_data[2]
 
-            skb = Packet()
-            skb.data = pkt[:length]
+            if interface.rx_zero_copy:
+                # hand the DMA buffer itself over, skb.release() gives it back
+                skb = Packet(pkt.view(0, length), buf=pkt, free=interface.driver.free_pkt)
+                ring.rx_info[ring_index] = None
+            else:
+                skb = Packet()
+                skb.data = pkt[:length]
+                ring.free_desc(ring_index)
+
             skb.queue = ring.index
             skb.timestamp_ns = cpl_data[3]
             skb.timestamp_s = cpl_data[4]
             skb.rx_checksum = cpl_data[5]
 
-            interface.log.info("Packet: %s", skb)
+            if trace_level >= MQNIC_TRACE_ENTRIES:
+                interface.log.info("Packet: %s", skb)
+
+            recorder = interface.driver.recorder
+            if recorder is not None:
+                recorder.record(f"if{interface.index}", skb.data, recorder.DIR_IN, ring.index)
 
             interface.pkt_rx_queue.append(skb)
             interface.pkt_rx_sync.set()
 
-            ring.free_desc(ring_index)
-
-            cq_cons_ptr += 1
-            cq_index = cq_cons_ptr & cq.size_mask
-
-        cq.cons_ptr = cq_cons_ptr
+        cq.cons_ptr += len(cpls)
         await cq.write_cons_ptr()
 
         # process ring
@@ -1090,6 +1572,8 @@ class Rxq:
         # replenish buffers
         await ring.refill_buffers()
 
+        return len(cpls)
+
 
 class BaseScheduler:
     def __init__(self, port, index, rb):
@@ -1141,7 +1625,7 @@ class SchedulerBlock:
         # Read ID registers
 
         offset = await self.block_rb.read_dword(MQNIC_RB_SCHED_BLOCK_REG_OFFSET)
-        await self.reg_blocks.enumerate_reg_blocks(self.block_rb.parent, offset)
+        await self.reg_blocks.enumerate_reg_blocks(self.block_rb.parent, offset, self.driver.reg_cache)
 
         self.schedulers = []
 
@@ -1183,7 +1667,7 @@ class Port:
         # Read ID registers
 
         offset = await self.port_rb.read_dword(MQNIC_RB_PORT_REG_OFFSET)
-        await self.reg_blocks.enumerate_reg_blocks(self.port_rb.parent, offset)
+        await self.reg_blocks.enumerate_reg_blocks(self.port_rb.parent, offset, self.driver.reg_cache)
 
         self.port_ctrl_rb = self.reg_blocks.find(MQNIC_RB_PORT_CTRL_TYPE, MQNIC_RB_PORT_CTRL_VER)
 
@@ -1279,11 +1763,15 @@ class Interface:
         self.pkt_rx_queue = deque()
         self.pkt_rx_sync = Event()
 
+        # if set, received Packets are views over the RX DMA buffers,
+        # which are only recycled once the consumer calls Packet.release()
+        self.rx_zero_copy = False
+
     async def init(self):
         # Read ID registers
 
         # Enumerate registers
-        await self.reg_blocks.enumerate_reg_blocks(self.hw_regs, self.driver.if_csr_offset)
+        await self.reg_blocks.enumerate_reg_blocks(self.hw_regs, self.driver.if_csr_offset, self.driver.reg_cache)
 
         self.if_ctrl_rb = self.reg_blocks.find(MQNIC_RB_IF_CTRL_TYPE, MQNIC_RB_IF_CTRL_VER)
 
@@ -1428,24 +1916,55 @@ class Interface:
         # wait for all writes to complete
         await self.hw_regs.read_dword(0)
 
-    async def open(self):
-        for k in range(self.rxq_res.get_count()):
-            cq = Cq(self)
-            await cq.open(self.eq[k % len(self.eq)], 1024)
-            await cq.arm()
-            rxq = Rxq(self)
-            await rxq.open(cq, 1024, 4)
-            await rxq.enable()
-            self.rxq.append(rxq)
+    async def open(self, rxq_count=None, txq_count=None):
+        """Bring up the queues and enable the port
 
-        for k in range(self.txq_res.get_count()):
-            cq = Cq(self)
-            await cq.open(self.eq[k % len(self.eq)], 1024)
-            await cq.arm()
-            txq = Txq(self)
-            await txq.open(cq, 1024, 4)
-            await txq.enable()
-            self.txq.append(txq)
+        The queues are brought up concurrently, so their register writes go
+        out back-to-back (they're posted), rather than one queue at a time,
+        with a single read to fence the lot at the end.
+
+        Parameters
+        ----------
+        rxq_count: int | None = None
+            how many RX queues to open, defaults to all of them
+
+        txq_count: int | None = None
+            how many TX queues to open, defaults to all of them
+        """
+        if rxq_count is None:
+            rxq_count = self.rxq_res.get_count()
+        if txq_count is None:
+            txq_count = self.txq_res.get_count()
+
+        rxq_count = min(rxq_count, self.rxq_res.get_count())
+        txq_count = min(txq_count, self.txq_res.get_count())
+
+        # two phases, CQs then queues, since tasks run up to their first await
+        # in launch order, every index gets allocated in the same order as
+        # it would be sequentially
+        rx_cqs = [Cq(self) for k in range(rxq_count)]
+        tx_cqs = [Cq(self) for k in range(txq_count)]
+
+        # every index up front, in one go per resource (lowest first, so the
+        # same ones the queues would've allocated one by one)
+        cqns = self.cq_res.alloc_many(rxq_count + txq_count)
+        rxq_indices = self.rxq_res.alloc_many(rxq_count)
+        txq_indices = self.txq_res.alloc_many(txq_count)
+
+        await self._open_all(
+            [self._open_cq(cq, k, cqn) for k, (cq, cqn) in enumerate(zip(rx_cqs, cqns))]
+            + [
+                self._open_cq(cq, k, cqn)
+                for k, (cq, cqn) in enumerate(zip(tx_cqs, cqns[rxq_count:]))
+            ]
+        )
+
+        queues = await self._open_all(
+            [self._open_rxq(cq, index) for cq, index in zip(rx_cqs, rxq_indices)]
+            + [self._open_txq(cq, index) for cq, index in zip(tx_cqs, txq_indices)]
+        )
+        self.rxq.extend(queues[:rxq_count])
+        self.txq.extend(queues[rxq_count:])
 
         # wait for all writes to complete
         await self.hw_regs.read_dword(0)
@@ -1455,6 +1974,27 @@ class Interface:
 
         self.port_up = True
 
+    @staticmethod
+    async def _open_all(coros):
+        tasks = [cocotb.start_soon(coro) for coro in coros]
+        return [await task for task in tasks]
+
+    async def _open_cq(self, cq, k, cqn):
+        await cq.open(self.eq[k % len(self.eq)], 1024, cqn)
+        await cq.arm()
+
+    async def _open_rxq(self, cq, index):
+        rxq = Rxq(self)
+        await rxq.open(cq, 1024, 4, index)
+        await rxq.enable()
+        return rxq
+
+    async def _open_txq(self, cq, index):
+        txq = Txq(self)
+        await txq.open(cq, 1024, 4, index)
+        await txq.enable()
+        return txq
+
     async def close(self):
         self.port_up = False
 
@@ -1469,17 +2009,26 @@ class Interface:
         # wait for all writes to complete
         await self.hw_regs.read_dword(0)
 
+        # indices all go back in one go per resource, once everything's closed
+        cqns = [q.cq.cqn for q in self.txq + self.rxq]
+        txq_indices = [q.index for q in self.txq]
+        rxq_indices = [q.index for q in self.rxq]
+
         for q in self.txq:
             cq = q.cq
             q.free_buf()
-            await q.close()
-            await cq.close()
+            await q.close(free_index=False)
+            await cq.close(free_index=False)
 
         for q in self.rxq:
             cq = q.cq
             q.free_buf()
-            await q.close()
-            await cq.close()
+            await q.close(free_index=False)
+            await cq.close(free_index=False)
+
+        self.txq_res.free_many(txq_indices)
+        self.rxq_res.free_many(rxq_indices)
+        self.cq_res.free_many(cqns)
 
         self.txq = []
         self.rxq = []
@@ -1515,12 +2064,6 @@ class Interface:
         if not self.port_up:
             return
 
-        # turns skb data into bytes (in case it's not already)
-        data = bytes(skb)
-
-        # verifying that the data is smaller than the max tx unit
-        assert len(data) < self.max_tx_mtu
-
         # use tx ring you specified, else use default: 0
         if tx_ring is not None:
             ring_index = tx_ring
@@ -1530,6 +2073,73 @@ class Interface:
         # obtain 'pointer' to the tx queue / ring you wanted
         ring = self.txq[ring_index]
 
+        await self._wait_tx_space(ring)
+
+        self._post_tx_desc(ring, skb, csum_start, csum_offset)
+
+        await ring.write_prod_ptr()
+
+    async def start_xmit_batch(
+        self, skbs, tx_ring: int | None = None, csum_start=None, csum_offset=None
+    ):
+        """Start Transmission of a burst of packets, ringing the doorbell once
+
+        Same as `start_xmit`, but all descriptors are packed into the ring
+        before a single producer pointer write is issued,
+        rather than one (simulated MMIO) doorbell write per packet.
+
+        Parameters
+        ----------
+        skbs: Iterable[bytes | bytearray]
+            the packets you want to send, in order
+
+        tx_ring: int | None
+            which transmission ring do you want to send the packets from?
+
+        csum_start: int | None
+            as in `start_xmit`, applied to every packet in the burst
+
+        csum_offset: int | None
+            as in `start_xmit`, applied to every packet in the burst
+
+        Returns
+        -------
+        count: int
+            how many packets were posted to the ring
+
+        Note
+        ----
+        if the burst is larger than the space in the ring,
+        the doorbell is rung for what's been posted so far,
+        so the DUT can drain the ring and free up space for the rest
+        """
+        if not self.port_up:
+            return 0
+
+        ring = self.txq[tx_ring if tx_ring is not None else 0]
+
+        count = 0
+        posted = 0
+
+        for skb in skbs:
+            if ring.full():
+                # ring the doorbell before waiting, else nothing will drain
+                if posted:
+                    await ring.write_prod_ptr()
+                    posted = 0
+
+                await self._wait_tx_space(ring)
+
+            self._post_tx_desc(ring, skb, csum_start, csum_offset)
+            posted += 1
+            count += 1
+
+        if posted:
+            await ring.write_prod_ptr()
+
+        return count
+
+    async def _wait_tx_space(self, ring: Txq):
         while True:
             # check for space in ring
             if ring.prod_ptr - ring.cons_ptr < ring.full_size:
@@ -1539,6 +2149,21 @@ class Interface:
             ring.clean_event.clear()
             await ring.clean_event.wait()
 
+    def _post_tx_desc(self, ring: Txq, skb, csum_start=None, csum_offset=None):
+        """writes one packet's descriptors into the ring, without the doorbell
+
+        the caller must've made sure there's space in the ring
+        """
+        # turns skb data into bytes (in case it's not already)
+        data = bytes(skb)
+
+        recorder = self.driver.recorder
+        if recorder is not None:
+            recorder.record(f"if{self.index}", data, recorder.DIR_OUT, ring.index)
+
+        # verifying that the data is smaller than the max tx unit
+        assert len(data) < self.max_tx_mtu
+
         # index is wrapped using a mask (more efficient)
         index = ring.prod_ptr & ring.size_mask
 
@@ -1581,8 +2206,6 @@ class Interface:
 
         ring.prod_ptr += 1
 
-        await ring.write_prod_ptr()
-
     async def set_mtu(self, mtu):
         await self.if_ctrl_rb.write_dword(MQNIC_RB_IF_CTRL_REG_TX_MTU, mtu)
         await self.if_ctrl_rb.write_dword(MQNIC_RB_IF_CTRL_REG_RX_MTU, mtu)
@@ -1609,6 +2232,11 @@ class Interface:
     async def set_rx_queue_map_indir_table(self, port, index, val):
         await self.rx_queue_map_indir_table[port].write_dword(index*4, val)
 
+    async def write_rx_queue_map_indir_table(self, port, values, start=0):
+        """program a run of indirection table entries in one posted batch"""
+        async with PostedWrites(self.rx_queue_map_indir_table[port]) as regs:
+            regs.write_dwords(start*4, values)
+
     async def recv(self):
         if not self.pkt_rx_queue:
             self.pkt_rx_sync.clear()
@@ -1672,8 +2300,21 @@ class Driver:
 
         self.irq_sig = None
         self.irq_list = []
+        # irq index -> EQs that signal it, kept up to date by Eq.open/close
+        self.irq_eqs: dict[int, list[Eq]] = {}
+
+        # NAPI-style polling: when set, each interrupt polls EQs/CQs in
+        # passes of at most this many entries until they're dry, and only
+        # then re-arms them (once each); None keeps arm-per-event behaviour
+        self.napi_budget = None
+
+        self.irq_count = 0
+        self.event_count = 0
+        self.cpl_count = 0
 
         self.reg_blocks = RegBlockList()
+        # optional RegBlockCache, to skip re-enumerating a known bitstream
+        self.reg_cache = None
         self.fw_id_rb = None
         self.if_rb = None
         self.phc_rb = None
@@ -1702,8 +2343,12 @@ class Driver:
         self.interfaces: List[Interface] = []
 
         self.pkt_buf_size = 16384
-        self.allocated_packets = []
-        self.free_packets = deque()
+        # buffers reserved per slab chunk, the slab grows a chunk at a time
+        self.pkt_slab_count = 1024
+        self.pkt_slab: PacketSlab = None  # type: ignore
+
+        # optional corunlib.recorder.PacketRecorder, for pcapng traces
+        self.recorder = None
 
     async def init_pcie_dev(self, dev: PciDevice):
         assert not self.initialized
@@ -1754,7 +2399,9 @@ class Driver:
             self.log.info("RAM BAR size: %d", self.ram_hw_regs.size)
 
         # Enumerate registers
-        await self.reg_blocks.enumerate_reg_blocks(self.hw_regs)
+        if self.reg_cache is not None and await self.reg_cache.validate(self.hw_regs):
+            self.log.info("Using cached register map (%s)", self.reg_cache.key)
+        await self.reg_blocks.enumerate_reg_blocks(self.hw_regs, cache=self.reg_cache)
 
         # Read ID registers
         self.fw_id_rb = self.reg_blocks.find(MQNIC_RB_FW_ID_TYPE, MQNIC_RB_FW_ID_VER)
@@ -1776,6 +2423,9 @@ class Driver:
         self.rel_info = await self.fw_id_rb.read_dword(MQNIC_RB_FW_ID_REG_REL_INFO)
         self.log.info("Release info: %d", self.rel_info)
 
+        if self.reg_cache is not None:
+            self.reg_cache.bind(self.fw_id, self.git_hash)
+
         rb = self.reg_blocks.find(MQNIC_RB_APP_INFO_TYPE, MQNIC_RB_APP_INFO_VER)
 
         if rb:
@@ -1806,6 +2456,9 @@ class Driver:
         else:
             self.log.warning("No interface block found")
 
+        if self.reg_cache is not None:
+            self.reg_cache.save()
+
     async def _run_edge_interrupts(self, signal):
         last_val = 0
         count = len(signal)
@@ -1817,23 +2470,79 @@ class Driver:
                 await self.irq_list[index].interrupt()
 
     async def interrupt_handler(self, index):
-        self.log.info("Interrupt handler start (IRQ %d)", index)
-        for i in self.interfaces:
-            for eq in i.eq:
-                if eq.irq == index:
-                    await eq.process_eq()
-                    await eq.arm()
-        self.log.info("Interrupt handler end (IRQ %d)", index)
+        if trace_level >= MQNIC_TRACE_EVENTS:
+            self.log.info("Interrupt handler start (IRQ %d)", index)
+
+        self.irq_count += 1
+        eqs = self.irq_eqs.get(index, ())
+
+        if self.napi_budget is None:
+            for eq in eqs:
+                await eq.process_eq()
+                await eq.arm()
+        else:
+            await self._napi_poll(eqs, self.napi_budget)
+
+        if trace_level >= MQNIC_TRACE_EVENTS:
+            self.log.info("Interrupt handler end (IRQ %d)", index)
+
+    async def _napi_poll(self, eqs, budget):
+        armed = {}
+
+        while True:
+            # collect every CQ with work, each only once, however many
+            # events it generated
+            pending = {}
+            events = 0
+            for eq in eqs:
+                events += await eq.poll_events(budget, pending)
+
+            if not events:
+                break
+
+            # drain each CQ, a budget at a time
+            for cq in pending:
+                while True:
+                    count = await cq.handler(cq, budget)
+                    self.cpl_count += count
+                    if count < budget:
+                        break
+
+            armed.update(pending)
+
+        # then re-arm, just the once, and sweep up anything that landed
+        # after the CQ was drained (there won't be an event for that)
+        for cq in armed:
+            await cq.arm()
+            if cq.read_cpls(1):
+                while True:
+                    count = await cq.handler(cq, budget)
+                    self.cpl_count += count
+                    if count < budget:
+                        break
+        for eq in eqs:
+            await eq.arm()
+
+    def get_irq_stats(self):
+        return {
+            "irqs": self.irq_count,
+            "events": self.event_count,
+            "completions": self.cpl_count,
+        }
 
     def alloc_pkt(self):
-        if self.free_packets:
-            return self.free_packets.popleft()
+        if self.pkt_slab is None:
+            self.pkt_slab = PacketSlab(self.pool, self.pkt_buf_size, self.pkt_slab_count)
 
-        pkt = self.pool.alloc_region(self.pkt_buf_size)
-        self.allocated_packets.append(pkt)
-        return pkt
+        return self.pkt_slab.alloc()
 
     def free_pkt(self, pkt):
         assert pkt is not None
-        assert pkt in self.allocated_packets
-        self.free_packets.append(pkt)
+        self.pkt_slab.free(pkt)
+
+    def get_pkt_stats(self):
+        """packet buffer usage: capacity, outstanding, peak (high-water mark)"""
+        if self.pkt_slab is None:
+            return {'capacity': 0, 'outstanding': 0, 'peak': 0, 'chunks': 0}
+
+        return self.pkt_slab.get_stats()
@@ -0,0 +1,179 @@
+"""
+Cheap packet/payload generation, for tests that fire off lots of packets
+
+Payloads are just slices of one rotating base buffer (so a C-level copy,
+rather than a Python loop per byte), and headers are built by scapy once per
+`HeaderTemplate`, with the per-packet fields (ports, IPs, lengths, checksums)
+patched straight into a copy of the bytes.
+"""
+
+import socket
+import struct
+
+import scapy.utils
+from scapy.layers.inet import IP, TCP, UDP
+from scapy.packet import Packet
+
+
+# bytes(range(256)), repeated as often as the largest payload needs;
+# grown (never shrunk) on demand
+_base = bytes(range(256)) * 2
+
+
+def payload(size: int, k: int = 0) -> bytes:
+    """the k-th test payload of a given size
+
+    Equivalent to `bytearray([(x+k) % 256 for x in range(size)])`,
+    just without building a list for every packet.
+    """
+    global _base
+
+    k %= 256
+    if k + size > len(_base):
+        _base = bytes(range(256)) * ((k + size) // 256 + 1)
+
+    return _base[k:k+size]
+
+
+def payloads(count: int, size: int) -> list[bytes]:
+    """`count` payloads of `size` bytes, each rotated one byte on from the last"""
+    return [payload(size, k) for k in range(count)]
+
+
+class HeaderTemplate:
+    """A header stack, built once by scapy, then patched per packet
+
+    Usage
+    -----
+    ```python
+    template = HeaderTemplate(eth / ip / UDP(sport=1, dport=0))
+    pkts = [template.build(payload(256), dport=k) for k in range(64)]
+    ```
+    """
+
+    # where the ports/checksum live, relative to the start of the L4 header
+    _L4_CHKSUM = {UDP: 6, TCP: 16}
+
+    def __init__(self, header_stack: Packet):
+        """
+        Parameters
+        ----------
+        header_stack: Packet
+            just the headers, e.g. `Ether() / IP() / UDP()`;
+            anything left for scapy to fill in (lengths, checksums)
+            gets recomputed per packet
+        """
+        self.header_stack = header_stack
+
+        # built headers, by payload length
+        self._headers: dict[int, bytes] = {}
+
+        # find where each layer starts, from a throwaway build
+        built = header_stack.__class__(header_stack.build())
+
+        self.ip_offset = None
+        self.l4_offset = None
+        self.l4 = None
+
+        if IP in built:
+            self.ip_offset = len(built) - len(built[IP])
+            for layer in self._L4_CHKSUM:
+                if layer in built:
+                    self.l4 = layer
+                    self.l4_offset = len(built) - len(built[layer])
+                    break
+
+        # only fill in the L4 checksum if scapy would have,
+        # an explicitly set one (e.g. 0, for none) is left alone
+        self.l4_csum = (
+            self.l4 is not None and header_stack[self.l4].chksum is None
+        )
+
+    def _header(self, length: int) -> bytes:
+        """the header bytes for a given payload length, scapy-built once"""
+        header = self._headers.get(length)
+        if header is None:
+            pkt = (self.header_stack / bytes(length)).build()
+            header = self._headers[length] = pkt[:len(pkt) - length]
+        return header
+
+    def build(
+        self, data: bytes, src: str | None = None, dst: str | None = None,
+        sport: int | None = None, dport: int | None = None
+    ) -> bytearray:
+        """the full packet, with `data` as its payload
+
+        Parameters
+        ----------
+        data: bytes
+            the payload
+
+        src: str | None = None
+            IPv4 source address, if it differs from the template's
+
+        dst: str | None = None
+            IPv4 destination address, if it differs from the template's
+
+        sport: int | None = None
+            L4 source port, if it differs from the template's
+
+        dport: int | None = None
+            L4 destination port, if it differs from the template's
+
+        Returns
+        -------
+        bytearray
+            so it can be patched some more, if needs be
+        """
+        pkt = bytearray(self._header(len(data)))
+        pkt += data
+
+        if src is not None or dst is not None:
+            if self.ip_offset is None:
+                raise ValueError("header template has no IPv4 layer to patch")
+            self._patch_ip(pkt, src, dst)
+
+        if sport is not None or dport is not None:
+            if self.l4_offset is None:
+                raise ValueError("header template has no UDP/TCP layer to patch")
+            if sport is not None:
+                struct.pack_into("!H", pkt, self.l4_offset, sport)
+            if dport is not None:
+                struct.pack_into("!H", pkt, self.l4_offset + 2, dport)
+
+        # the cached header's checksum only covers the all-zero payload
+        if self.l4_csum:
+            self._patch_l4_csum(pkt)
+
+        return pkt
+
+    def _patch_ip(self, pkt: bytearray, src: str | None, dst: str | None):
+        off = self.ip_offset
+        if src is not None:
+            pkt[off+12:off+16] = socket.inet_aton(src)
+        if dst is not None:
+            pkt[off+16:off+20] = socket.inet_aton(dst)
+
+        ihl = (pkt[off] & 0x0f) * 4
+        struct.pack_into("!H", pkt, off + 10, 0)
+        struct.pack_into(
+            "!H", pkt, off + 10, scapy.utils.checksum(bytes(pkt[off:off+ihl]))
+        )
+
+    def _patch_l4_csum(self, pkt: bytearray):
+        ip, l4 = self.ip_offset, self.l4_offset
+        csum_at = l4 + self._L4_CHKSUM[self.l4]
+
+        struct.pack_into("!H", pkt, csum_at, 0)
+
+        segment = bytes(pkt[l4:])
+        pseudo = (
+            bytes(pkt[ip+12:ip+20])
+            + struct.pack("!BBH", 0, pkt[ip+9], len(segment))
+        )
+
+        csum = scapy.utils.checksum(pseudo + segment)
+        if self.l4 is UDP and csum == 0:
+            csum = 0xffff  # 0 means "no checksum" for UDP
+
+        struct.pack_into("!H", pkt, csum_at, csum)
@@ -0,0 +1,131 @@
+"""
+Event-driven packet pumps, to replace fixed `Timer` sleeps in serve loops
+
+A `Pump` drains everything its source has available, back-to-back,
+and only gives up sim time when there's genuinely nothing left to do.
+"""
+
+import cocotb
+from cocotb.triggers import Timer
+from cocotb.utils import get_sim_time
+
+from decimal import Decimal
+from typing import Any, Awaitable, Callable
+
+
+class Pump:
+    """Moves items from a non-blocking source into an async sink, ASAP"""
+
+    def __init__(
+        self, name: str,
+        source: Callable[[], Any | None],
+        sink: Callable[[Any], Awaitable[Any]],
+        wait: Callable[[], Awaitable[Any]] | None = None,
+        batch_size: int = 64,
+        min_backoff: Decimal = Decimal(10),
+        max_backoff: Decimal = Decimal(10_000),
+    ):
+        """
+        Parameters
+        ----------
+        name: str
+            just for the logs/stats
+
+        source: Callable[[], Any | None]
+            returns the next item, or None if there's nothing available;
+            must never block (e.g. `EthMacTx.recv_nowait`)
+
+        sink: Callable[[Any], Awaitable]
+            what to do with each item
+
+        wait: Callable[[], Awaitable] | None = None
+            resolves once the source has something to give
+            (e.g. `EthMacTx.wait`); if the source can't signal that,
+            like anything fed from a host thread, leave this as None and
+            the pump will poll with an exponential backoff instead
+
+        batch_size: int = 64
+            most items handled before re-checking the source's signal,
+            just to stop one busy pump hogging the scheduler
+
+        min_backoff: Decimal = 10
+            first idle poll interval (in ns), when there's no `wait`
+
+        max_backoff: Decimal = 10000
+            longest idle poll interval (in ns), when there's no `wait`
+        """
+        self.name = name
+        self.source = source
+        self.sink = sink
+        self.wait = wait
+
+        self.batch_size = batch_size
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        self.count = 0
+        self.start_time = None
+        self.last_time = None
+
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self.start_time = get_sim_time('ns')
+            self._task = cocotb.start_soon(self._run())
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    async def drain(self) -> int:
+        """handle everything currently available (up to `batch_size`)
+
+        Returns
+        -------
+        int
+            how many items were handled
+        """
+        n = 0
+        while n < self.batch_size:
+            item = self.source()
+            if item is None:
+                break
+            await self.sink(item)
+            n += 1
+
+        if n:
+            self.count += n
+            self.last_time = get_sim_time('ns')
+
+        return n
+
+    async def _run(self):
+        backoff = self.min_backoff
+
+        while True:
+            if await self.drain():
+                backoff = self.min_backoff
+                continue
+
+            # nothing to do, so get out of the way 'til there is
+            if self.wait is not None:
+                await self.wait()
+            else:
+                await Timer(backoff, 'ns')
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def get_rate(self) -> float:
+        """packets per simulated second, from start to the last packet"""
+        if not self.count or self.last_time == self.start_time:
+            return 0.0
+        return self.count * 1e9 / (self.last_time - self.start_time)
+
+    def get_stats(self) -> dict:
+        return {
+            "name": self.name,
+            "count": self.count,
+            "pps": self.get_rate(),
+        }
@@ -0,0 +1,241 @@
+"""
+Binary packet trace recording, with pcapng export for Wireshark & co.
+
+Recording just copies the frame into a preallocated ring of fixed-size slots,
+plus a handful of array entries for the metadata, so it's cheap enough to
+leave switched on in hot paths; all the actual file writing happens in a
+background thread, on `flush`.
+"""
+
+from array import array
+from pathlib import Path
+import queue
+import struct
+import threading
+
+from cocotb.utils import get_sim_time
+
+
+# direction of a recorded frame, relative to the simulated NIC:
+# inbound is heading into the NIC's world (host rx, MAC rx, TAP -> DUT),
+# outbound is heading out of it (host tx, MAC tx, DUT -> TAP)
+DIR_IN  = 1
+DIR_OUT = 2
+
+# pcapng block types and option codes
+_SHB_TYPE = 0x0A0D0D0A
+_IDB_TYPE = 0x00000001
+_EPB_TYPE = 0x00000006
+_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+_LINKTYPE_ETHERNET = 1
+
+_OPT_ENDOFOPT = 0
+_OPT_IF_NAME = 2
+_OPT_IF_TSRESOL = 9
+_OPT_EPB_FLAGS = 2
+_OPT_EPB_QUEUE = 6
+
+_NO_QUEUE = 0xFFFFFFFF
+
+
+def _pad4(n: int) -> int:
+    return (4 - n % 4) % 4
+
+
+def _option(code: int, value: bytes) -> bytes:
+    return struct.pack("<HH", code, len(value)) + value + bytes(_pad4(len(value)))
+
+
+def _block(block_type: int, body: bytes) -> bytes:
+    total = 12 + len(body)
+    return struct.pack("<LL", block_type, total) + body + struct.pack("<L", total)
+
+
+class PacketRecorder:
+    """Records frames into a preallocated ring buffer, for export as pcapng"""
+
+    # so hooks only need the instance, not an import
+    DIR_IN = DIR_IN
+    DIR_OUT = DIR_OUT
+
+    def __init__(self, capacity: int = 65536, snaplen: int = 2048):
+        """
+        Parameters
+        ----------
+        capacity: int = 65536
+            how many frames the ring holds; if more than this are recorded
+            between flushes, the oldest ones get overwritten (and counted)
+
+        snaplen: int = 2048
+            most bytes kept per frame, the rest is truncated
+            (the original length is still recorded)
+        """
+        self.capacity = capacity
+        self.snaplen = snaplen
+
+        self.buf = bytearray(capacity * snaplen)
+        self.time = array('Q', [0]) * capacity
+        self.iface = array('H', [0]) * capacity
+        self.queue = array('L', [0]) * capacity
+        self.orig_len = array('L', [0]) * capacity
+        self.cap_len = array('L', [0]) * capacity
+        self.direction = array('B', [0]) * capacity
+
+        # total frames ever recorded, and how many of those have been flushed
+        self.head = 0
+        self.flushed = 0
+        self.overwritten = 0
+
+        self.interfaces: dict[str, int] = {}
+
+        self._writer = None
+        self._write_queue: queue.Queue = queue.Queue()
+        self._written_ifaces: dict[Path, int] = {}
+
+    def add_interface(self, name: str) -> int:
+        """register a named interface (idempotent), returning its pcapng id"""
+        iface_id = self.interfaces.get(name)
+        if iface_id is None:
+            iface_id = self.interfaces[name] = len(self.interfaces)
+        return iface_id
+
+    def record(self, name: str, data, direction: int, queue: int | None = None):
+        """copy one frame into the ring
+
+        Parameters
+        ----------
+        name: str
+            which interface saw it, e.g. "if0", "port1", "tap0";
+            new names are registered on the fly
+
+        data: bytes-like
+            the frame itself
+
+        direction: int
+            DIR_IN or DIR_OUT
+
+        queue: int | None = None
+            the hardware queue it went through, if that's meaningful
+        """
+        iface_id = self.interfaces.get(name)
+        if iface_id is None:
+            iface_id = self.add_interface(name)
+
+        slot = self.head % self.capacity
+        if self.head - self.flushed >= self.capacity:
+            self.overwritten += 1
+
+        length = len(data)
+        cap = min(length, self.snaplen)
+        offset = slot * self.snaplen
+        self.buf[offset:offset+cap] = data[:cap]
+
+        self.time[slot] = get_sim_time('ns')
+        self.iface[slot] = iface_id
+        self.queue[slot] = _NO_QUEUE if queue is None else queue
+        self.orig_len[slot] = length
+        self.cap_len[slot] = cap
+        self.direction[slot] = direction
+
+        self.head += 1
+
+    def _snapshot(self) -> list[tuple]:
+        """pull everything recorded since the last flush out of the ring"""
+        start = max(self.flushed, self.head - self.capacity)
+        records = []
+        for n in range(start, self.head):
+            slot = n % self.capacity
+            offset = slot * self.snaplen
+            records.append((
+                self.time[slot], self.iface[slot], self.queue[slot],
+                self.orig_len[slot], self.direction[slot],
+                bytes(self.buf[offset:offset+self.cap_len[slot]]),
+            ))
+        self.flushed = self.head
+        return records
+
+    def flush(self, path: str | Path):
+        """append everything recorded since the last flush to a pcapng file
+
+        Only the copy out of the ring happens here, the encoding and file I/O
+        are handed off to a background writer thread, so this is quick.
+        The file is (re)started on the first flush to a given path.
+        """
+        records = self._snapshot()
+        names = sorted(self.interfaces, key=self.interfaces.get)
+        self._write_queue.put((Path(path), names, records))
+
+        if self._writer is None:
+            self._writer = threading.Thread(
+                target=self._write_loop, name="pcapng-writer", daemon=True
+            )
+            self._writer.start()
+
+    def close(self):
+        """wait for every pending flush to hit the disk"""
+        if self._writer is None:
+            return
+        self._write_queue.put(None)
+        self._writer.join()
+        self._writer = None
+
+    def _write_loop(self):
+        while (job := self._write_queue.get()) is not None:
+            self._write(*job)
+
+    def _write(self, path: Path, names: list[str], records: list[tuple]):
+        chunks = []
+
+        written = self._written_ifaces.get(path)
+        if written is None:
+            written = 0
+            chunks.append(self._shb())
+            mode = "wb"
+        else:
+            mode = "ab"
+
+        # IDBs can follow the SHB anywhere, so long as they come before
+        # the first EPB that refers to them
+        for name in names[written:]:
+            chunks.append(self._idb(name))
+        self._written_ifaces[path] = len(names)
+
+        for record in records:
+            chunks.append(self._epb(*record))
+
+        with open(path, mode) as f:
+            f.write(b"".join(chunks))
+
+    @staticmethod
+    def _shb() -> bytes:
+        # unknown section length (-1), no options
+        body = struct.pack("<LHHq", _BYTE_ORDER_MAGIC, 1, 0, -1)
+        return _block(_SHB_TYPE, body)
+
+    def _idb(self, name: str) -> bytes:
+        body = struct.pack("<HHL", _LINKTYPE_ETHERNET, 0, self.snaplen)
+        body += _option(_OPT_IF_NAME, name.encode())
+        body += _option(_OPT_IF_TSRESOL, bytes([9]))  # nanoseconds
+        body += _option(_OPT_ENDOFOPT, b"")
+        return _block(_IDB_TYPE, body)
+
+    @staticmethod
+    def _epb(time, iface_id, queue, orig_len, direction, data) -> bytes:
+        body = struct.pack(
+            "<LLLLL", iface_id, time >> 32, time & 0xFFFFFFFF,
+            len(data), orig_len
+        )
+        body += data + bytes(_pad4(len(data)))
+        body += _option(_OPT_EPB_FLAGS, struct.pack("<L", direction))
+        if queue != _NO_QUEUE:
+            body += _option(_OPT_EPB_QUEUE, struct.pack("<L", queue))
+        body += _option(_OPT_ENDOFOPT, b"")
+        return _block(_EPB_TYPE, body)
+
+    def get_stats(self) -> dict:
+        return {
+            "recorded": self.head,
+            "flushed": self.flushed,
+            "overwritten": self.overwritten,
+            "interfaces": len(self.interfaces),
+        }
@@ -16,7 +16,7 @@ from cocotb.triggers import RisingEdge, FallingEdge, Timer
 
 from cocotbext.axi import AxiStreamBus
 from cocotbext.axi import AxiSlave, AxiBus, SparseMemoryRegion
-from cocotbext.eth import EthMac
+from cocotbext.eth import EthMac, EthMacFrame
 from cocotbext.pcie.core import RootComplex
 from cocotbext.pcie.xilinx.us import UltraScalePlusPcieDevice
 
@@ -38,7 +38,8 @@ class TB(object):
         self.dut = dut
 
         self.log = SimLog("cocotb.tb")
-        self.log.setLevel(logging.DEBUG)
+        # e.g. TB_LOG_LEVEL=DEBUG, for all the gory details
+        self.log.setLevel(os.environ.get("TB_LOG_LEVEL", "INFO").upper())
 
         # PCIe
         self.rc = RootComplex()
@@ -373,8 +374,9 @@ class TB(object):
         dut.s_axis_stat_tid.setimmediatevalue(0)
         dut.s_axis_stat_tvalid.setimmediatevalue(0)
 
-        self.loopback_enable = False
-        cocotb.start_soon(self._run_loopback())
+        # src port index -> (dst port index, loopback engine task),
+        # engines only exist while their loopback is enabled
+        self._loopback: dict[int, tuple[int, cocotb.Task]] = {}
 
     async def init(self):
 
@@ -416,11 +418,149 @@ class TB(object):
 
         await self.rc.enumerate()
 
-    async def _run_loopback(self):
-        while True:
-            await RisingEdge(self.dut.clk)
+    async def bring_up(self, rxq_count=None, txq_count=None):
+        """everything between a fresh TB and one that's ready to test
+
+        resets the DUT, enumerates PCIe, initialises the driver, opens every
+        interface, then enables the first scheduler on each for all its
+        queues; shared by every entry point, so they all come up the same way
+
+        Set TALC_REG_CACHE=<path> to reuse the enumerated register map
+        between runs of the same bitstream (see mqnic.RegBlockCache).
+
+        Parameters
+        ----------
+        rxq_count: int | None = None
+            RX queues to open per interface, defaults to all of them
+
+        txq_count: int | None = None
+            TX queues to open per interface, defaults to all of them
+        """
+        await self.init()
+
+        if cache_path := os.environ.get("TALC_REG_CACHE"):
+            self.driver.reg_cache = mqnic.RegBlockCache(cache_path)
+
+        self.log.info("Init driver")
+        if (device := self.rc.find_device(self.dev.functions[0].pcie_id)) is not None:
+            await self.driver.init_pcie_dev(device)
+        for interface in self.driver.interfaces:
+            await interface.open(rxq_count, txq_count)
+
+        # enable queues
+        self.log.info("Enable queues")
+        # (leaving the batch waits for all writes to complete)
+        async with mqnic.PostedWrites(self.driver.hw_regs) as regs:
+            for interface in self.driver.interfaces:
+                scheduler = interface.sched_blocks[0].schedulers[0]
+                regs.write_dword(
+                    mqnic.MQNIC_RB_SCHED_RR_REG_CTRL, 0x00000001,
+                    window=scheduler.rb
+                )
+                regs.write_dwords(
+                    0, [0x00000003]*len(interface.txq),
+                    window=scheduler.hw_regs
+                )
+
+    @property
+    def loopback_enable(self):
+        """is MAC loopback enabled on any port?
+
+        setting this to True loops every (not already looped) port back
+        onto itself, setting it to False tears down all loopback engines
+        """
+        return bool(self._loopback)
+
+    @loopback_enable.setter
+    def loopback_enable(self, enabled: bool):
+        if enabled:
+            for k in range(len(self.port_mac)):
+                if k not in self._loopback:
+                    self.set_loopback(k)
+        else:
+            self.clear_loopback()
+
+    def set_loopback(self, src: int, dst: int | None = None):
+        """loop frames sent out of port `src`'s MAC back into port `dst`'s MAC
+
+        Parameters
+        ----------
+        src: int
+            index (into port_mac) of the port whose TX frames are looped
+
+        dst: int | None = None
+            index of the port that receives them, defaults to `src` itself
+        """
+        if dst is None:
+            dst = src
+
+        if src in self._loopback:
+            if self._loopback[src][0] == dst:
+                return
+            self.clear_loopback(src)
+
+        task = cocotb.start_soon(
+            self._run_loopback(self.port_mac[src], self.port_mac[dst])
+        )
+        self._loopback[src] = (dst, task)
+
+    def clear_loopback(self, src: int | None = None):
+        """stop looping port `src`, or all ports if `src` is None"""
+        ports = list(self._loopback) if src is None else [src]
 
-            if self.loopback_enable:
-                for mac in self.port_mac:
-                    if not mac.tx.empty():
-                        await mac.rx.send(await mac.tx.recv())
+        for k in ports:
+            if k in self._loopback:
+                _, task = self._loopback.pop(k)
+                task.kill()
+
+    async def _run_loopback(self, src: EthMac, dst: EthMac):
+        # blocks on the MAC TX queue, so it only wakes when there's a frame
+        while True:
+            await dst.rx.send(await src.tx.recv())
+
+    def attach_recorder(self, recorder):
+        """record every frame through the driver and the port MACs
+
+        Parameters
+        ----------
+        recorder: corunlib.recorder.PacketRecorder
+            where the frames go; driver frames are recorded as "if{k}",
+            port MAC frames as "port{k}"
+        """
+        self.driver.recorder = recorder
+
+        for k, mac in enumerate(self.port_mac):
+            self._record_mac(f"port{k}", mac, recorder)
+
+    @staticmethod
+    def _record_mac(name: str, mac: EthMac, recorder):
+        # wraps the MAC's own methods, so every user (loopback, TAPServer,
+        # the tests themselves) gets recorded, without knowing about it
+        tx_recv, tx_recv_nowait = mac.tx.recv, mac.tx.recv_nowait
+        rx_send, rx_send_nowait = mac.rx.send, mac.rx.send_nowait
+
+        async def recv(*args, **kwargs):
+            frame = await tx_recv(*args, **kwargs)
+            recorder.record(name, frame.data, recorder.DIR_OUT)
+            return frame
+
+        def recv_nowait(*args, **kwargs):
+            frame = tx_recv_nowait(*args, **kwargs)
+            recorder.record(name, frame.data, recorder.DIR_OUT)
+            return frame
+
+        async def send(frame, *args, **kwargs):
+            recorder.record(name, _frame_data(frame), recorder.DIR_IN)
+            await rx_send(frame, *args, **kwargs)
+
+        def send_nowait(frame, *args, **kwargs):
+            recorder.record(name, _frame_data(frame), recorder.DIR_IN)
+            rx_send_nowait(frame, *args, **kwargs)
+
+        mac.tx.recv, mac.tx.recv_nowait = recv, recv_nowait
+        mac.rx.send, mac.rx.send_nowait = send, send_nowait
+
+
+def _frame_data(frame):
+    """EthMacRx.send takes EthMacFrames or anything bytes-like"""
+    return frame.data if isinstance(frame, EthMacFrame) else frame
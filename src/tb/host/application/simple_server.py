@@ -1,13 +1,10 @@
-import cocotb
-from decimal import Decimal
-from cocotb.triggers import Timer
-
 from cocotbext.eth import EthMacFrame
 
 from scapy.layers.inet import IP, UDP, TCP
 from scapy.layers.l2 import Ether
 from scapy.packet import Packet
 
+from corunlib.pump import Pump
 from netlib.iproute import IPRoute
 
 
@@ -53,16 +50,17 @@ class SimpleServer:
 
         self.app = self.apps[app_id]
 
-        addr_info = self.ipr.get_addr_info()
+        # cached by the (shared) IPRoute, so constructing lots of these is fine
+        link_info = self.ipr.get_link_info()
 
-        self.eth_addr = addr_info['eth'][0]['addr']
-        self.ip_addr = addr_info['ip'][0]['addr']
+        self.eth_addr = link_info.address
+        self.ip_addr = link_info.ipv4[0].address
 
         # save for later, just in case
-        self.addr_info = addr_info
+        self.link_info = link_info
 
         # finally, get the server started
-        cocotb.start_soon(self._serve())
+        self.pump = self._serve()
 
 
     def echo(self, packet: Packet):
@@ -154,7 +152,11 @@ class SimpleServer:
 
         self.tb.log.info("SimpleServer.serve: Listening for data...")
 
-        pkt: EthMacFrame = await iface.recv()
+        await self.handle(await iface.recv())
+
+    async def handle(self, pkt: EthMacFrame):
+        """runs a single received packet through the app, and sends the reply"""
+        iface = self.tb.driver.interfaces[0]
 
         # turn EthMacFrame.data (raw bytes) into scapy packet for ease-of-use
         packet = Ether(pkt.data)
@@ -179,14 +181,21 @@ class SimpleServer:
             f"SimpleServer.serve: Packet transmitted - {bytepacket!r}"
         )
 
-    async def _serve(self):
+    def _serve(self) -> Pump:
         """wrapping serve so it never stops serving,
         this also serves the purpose of making it obvious where the
         cocotb hooks into the system are
+
+        Everything the driver has received is handled back-to-back,
+        and the pump only sleeps on the interface's RX event when it's empty
         """
-        while True:
-            await self.serve()
-            await Timer(Decimal(2), 'us')
+        iface = self.tb.driver.interfaces[0]
+
+        self.tb.log.info("SimpleServer.serve: Listening for data...")
+
+        return Pump(
+            "simple_server", iface.recv_nowait, self.handle, wait=iface.wait
+        ).start()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,166 @@
+"""
+Runs the full_nic_test sub-tests as independent simulations, in parallel
+
+Every sub-test in `test_corundum.NIC_SUBTESTS` gets its own simulator
+instance (via the Makefile, so the HDL/params stay defined in one place),
+then the per-shard JUnit results are merged into a single file.
+
+Usage (from src/tb):
+    python run_regression.py [-j JOBS] [--only NAME ...] [-o merged.xml]
+
+Anything else make would normally take (SIM, WAVES, ...) can be passed
+through the environment as usual. Every simulator dumps its waves to the
+same file, so with WAVES=1 the shards run one at a time instead, each one's
+dump being moved to `<out-dir>/<name>.fst` once it's done.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import argparse
+import ast
+import os
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+TB_DIR = Path(__file__).resolve().parent
+
+# wherever the simulators leave their waves (icarus, verilator), see the Makefile
+WAVE_DUMPS = ["mqnic_core_pcie_us.fst", "dump.fst"]
+
+
+def nic_subtests(path: Path = TB_DIR / "test_corundum.py") -> list[str]:
+    """the sub-test names in test_corundum.NIC_SUBTESTS
+
+    Read straight out of the source, since importing test_corundum needs a
+    running simulator (it pulls in cocotb.triggers etc.)
+    """
+    for node in ast.parse(path.read_text()).body:
+        if (
+            isinstance(node, ast.Assign)
+            and any(
+                isinstance(target, ast.Name) and target.id == "NIC_SUBTESTS"
+                for target in node.targets
+            )
+        ):
+            return [ast.literal_eval(entry.elts[0]) for entry in node.value.elts]
+
+    raise RuntimeError(f"no NIC_SUBTESTS in {path}")
+
+
+NIC_SUBTESTS = nic_subtests()
+
+
+def run_shard(name: str, out_dir: Path) -> tuple[str, int, float]:
+    """simulate a single sub-test, returning (name, make's return code, time)"""
+    results = out_dir / f"results_{name}.xml"
+    log = out_dir / f"{name}.log"
+
+    env = dict(
+        os.environ,
+        MODULE="test_corundum",
+        TESTCASE=f"nic_{name}",
+        TALC_SHARD="1",
+        COCOTB_RESULTS_FILE=str(results),
+    )
+
+    start = time.monotonic()
+    with open(log, "w") as f:
+        proc = subprocess.run(
+            ["make", "-C", str(TB_DIR)], env=env,
+            stdout=f, stderr=subprocess.STDOUT
+        )
+
+    # (only ever one shard running at a time, with waves on)
+    if env.get("WAVES") == "1":
+        for dump in WAVE_DUMPS:
+            if (TB_DIR / dump).exists():
+                (TB_DIR / dump).replace(out_dir / f"{name}.fst")
+
+    return name, proc.returncode, time.monotonic() - start
+
+
+def merge_results(names: list[str], out_dir: Path, merged: Path) -> int:
+    """merge every shard's testcases into one JUnit file
+
+    Returns
+    -------
+    int
+        the number of failed (or missing) shards
+    """
+    suite = ET.Element("testsuite", name="all", package="all")
+    failed = 0
+
+    for name in names:
+        results = out_dir / f"results_{name}.xml"
+
+        if not results.exists():
+            # the sim fell over before cocotb could write anything
+            case = ET.SubElement(
+                suite, "testcase", name=f"nic_{name}", classname="test_corundum"
+            )
+            ET.SubElement(
+                case, "error", message=f"no results, see {out_dir / name}.log"
+            )
+            failed += 1
+            continue
+
+        for case in ET.parse(results).getroot().iter("testcase"):
+            if case.find("failure") is not None or case.find("error") is not None:
+                failed += 1
+            suite.append(case)
+
+    root = ET.Element("testsuites", name="results")
+    root.append(suite)
+    ET.ElementTree(root).write(merged, encoding="utf-8", xml_declaration=True)
+
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count() or 1,
+        help="simulators to run at once (default: one per CPU)"
+    )
+    parser.add_argument(
+        "--only", nargs="+", choices=NIC_SUBTESTS, metavar="NAME",
+        help="just run these sub-tests"
+    )
+    parser.add_argument(
+        "-o", "--output", type=Path, default=TB_DIR / "results.xml",
+        help="where to write the merged JUnit results"
+    )
+    parser.add_argument(
+        "--out-dir", type=Path, default=TB_DIR / "regression",
+        help="where the per-shard logs and results go"
+    )
+    args = parser.parse_args()
+
+    names = args.only or NIC_SUBTESTS
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+
+    if os.environ.get("WAVES") == "1" and args.jobs > 1:
+        print("WAVES=1: running one shard at a time, so the dumps don't clash")
+        args.jobs = 1
+
+    # the first shard runs alone, so the HDL only gets built the once,
+    # rather than by every make that sees a missing sim_build at the same time
+    outcomes = [run_shard(names[0], args.out_dir)]
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        outcomes += pool.map(lambda n: run_shard(n, args.out_dir), names[1:])
+
+    for name, code, elapsed in outcomes:
+        status = "ok" if code == 0 else f"make exited {code}"
+        print(f"nic_{name:<20} {elapsed:8.1f}s  {status}")
+
+    failed = merge_results(names, args.out_dir, args.output)
+    print(f"{len(names) - failed}/{len(names)} passed, results in {args.output}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
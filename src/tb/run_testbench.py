@@ -2,8 +2,10 @@ import cocotb
 from cocotb.triggers import Timer
 from decimal import Decimal
 
+import os
+
 from corunlib.testbench import TB
-from corunlib import mqnic
+from corunlib.recorder import PacketRecorder
 
 from tapaz import TAPServer
 from host.application import SimpleServer
@@ -19,27 +21,15 @@ async def run_testbench(dut):
     # Initialise TestBench DUT instance
     tb = TB(dut, msix_count=2**len(dut.core_pcie_inst.irq_index))
 
-    await tb.init()
-
-    tb.log.info("Init driver")
-    if (device := tb.rc.find_device(tb.dev.functions[0].pcie_id)) is not None:
-        await tb.driver.init_pcie_dev(device)
-    for interface in tb.driver.interfaces:
-        await interface.open()
-
-    # enable queues
-    tb.log.info("Enable queues")
-    for interface in tb.driver.interfaces:
-        await interface.sched_blocks[0].schedulers[0].rb.write_dword(
-            mqnic.MQNIC_RB_SCHED_RR_REG_CTRL, 0x00000001
-        )
-        for k in range(len(interface.txq)):
-            await interface.sched_blocks[0].schedulers[0].hw_regs.write_dword(
-                4*k, 0x00000003
-            )
+    # TALC_PCAP=<path> records every frame through the testbench, as pcapng
+    pcap_path = os.environ.get("TALC_PCAP")
+    recorder = None
+    if pcap_path:
+        recorder = PacketRecorder()
+        tb.attach_recorder(recorder)
+
+    await tb.bring_up()
 
-    # wait for all writes to complete
-    await tb.driver.hw_regs.read_dword(0)
     tb.log.info("<CORYSUMMARY> Initialisation complete")
 
     # -------------------- Start interactive testbench --------------------
@@ -53,7 +43,18 @@ async def run_testbench(dut):
     await Timer(Decimal(5), 'ns')
 
     # If you don't keep the main function busy, it'll shut down the testbench
+    ticks = 0
     while True:
         await Timer(Decimal(10), 'us')
+
+        ticks += 1
+        if ticks % 100 == 0:  # every ms of sim time
+            _tabby.log_stats()
+            if recorder is not None:
+                recorder.flush(pcap_path)
+            tb.log.info(
+                "SimpleServer: %d packets, %.0f pps (sim)",
+                _sam.pump.count, _sam.pump.get_rate()
+            )
         # to kill cocotb, send SIGQUIT (Ctrl+\ for me),
         # don't send SIGINT (Ctrl+C), that makes it stall
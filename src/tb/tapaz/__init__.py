@@ -8,4 +8,4 @@ it's a play on topaz, another mineral, like Corundum
 #ruff: noqa F401
 
 from tapaz.client import TAPClient
-from tapaz.server import TAPServer
+from tapaz.server import TAPServer, TAPPort
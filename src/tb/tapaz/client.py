@@ -20,6 +20,10 @@ class TAPClient:
     def send(self, packet: Packet):
         self.tap.send(packet)
 
+    def send_many(self, frames) -> int:
+        """send a batch of raw frames (bytes), skipping scapy altogether"""
+        return self.tap.send_many(frames)
+
 
 if __name__ == "__main__":
     tom = TAPClient()
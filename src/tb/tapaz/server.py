@@ -1,91 +1,254 @@
-import cocotb
-from cocotb.triggers import Timer
-from decimal import Decimal
+from cocotb.utils import get_sim_time
+import logging
 
 from cocotbext.eth.eth_mac import EthMacFrame
 from scapy.layers.l2 import Ether
 # from scapy.packet import Packet
 
+from corunlib.pump import Pump
 from netlib.iproute import IPRoute
 from netlib.tap import Tap
+from netlib.utils import flow_hash
 
 
-class TAPServer:
-    # instantiate ip helper
-    ipr = IPRoute()
-
-    def __init__(self, tb):
-        # instantiate TAP device
-        self.tap = Tap(no_ip=True)
-
-        # attach to the tesbench (for access to DUT)
-        self.tb = tb
+class TAPPort:
+    """One TAP device, bridged to one of the DUT's MACs"""
 
-        # get the servers up and running
-        cocotb.start_soon(self._serve_mac())
-        cocotb.start_soon(self._serve_tap())
+    def __init__(self, index: int, tap: Tap, mac):
+        self.index = index
+        self.tap = tap
+        self.mac = mac
 
+        # host -> DUT
+        self.to_dut_frames = 0
+        self.to_dut_bytes = 0
+        # DUT -> host
+        self.to_host_frames = 0
+        self.to_host_bytes = 0
 
-    async def serve_tap(self):
-        # TODO: rewrite this code to work for all interfaces
-        iface = self.tb.driver.interfaces[0]
+        # the same frame counts, split by TAP queue
+        self.to_dut_queue_frames = [0] * tap.queues
+        self.to_host_queue_frames = [0] * tap.queues
 
-        self.tb.log.info("TAPServer.serve_tap: Listening for packets...")
+        self.start_time = get_sim_time('ns')
 
-        # Note: this is the important blocking call,
-        # nothing super interesting should happen until a packet is received.
-        packet = self.tap.listen()
+    def get_stats(self) -> dict:
+        """frame/byte counts in each direction, plus the rates (in Gbps)
+        they work out to, over the simulated time this port has been up"""
+        elapsed = get_sim_time('ns') - self.start_time
 
-        self.tb.log.info(
-            f"<CORYSUMMARY> TAPServer.serve_tap: Got a frame! - {packet!r}"
-        )
+        def rate(n_bytes):
+            return n_bytes * 8 / elapsed if elapsed else 0.0
 
-        # EthMacRx.send actually wraps raw bytes in EthMacFrame for us!
-        # its constructor also safely transfers data from one EMF to another, so
-        # I'm wrapping it just in case a cosmic ray makes it skips that line...
-        frame = EthMacFrame(packet.build())
-
-        self.tb.log.info(
-            f"<CORYSUMMARY> TAPServer.serve_tap: repacked frame - {frame!r}"
-        )
+        return {
+            "port": self.index,
+            "dev": self.tap.dev,
+            "to_dut_frames": self.to_dut_frames,
+            "to_dut_bytes": self.to_dut_bytes,
+            "to_dut_gbps": rate(self.to_dut_bytes),
+            "to_host_frames": self.to_host_frames,
+            "to_host_bytes": self.to_host_bytes,
+            "to_host_gbps": rate(self.to_host_bytes),
+            "to_dut_queue_frames": list(self.to_dut_queue_frames),
+            "to_host_queue_frames": list(self.to_host_queue_frames),
+        }
 
-        # as we're currently locked to iface 0, this should be using port_mac 0
-        await self.tb.port_mac[iface.index*iface.port_count].rx.send(frame)
 
-        self.tb.log.info("TAPServer.serve_tap: frame sent to DUT!")
+class TAPServer:
+    # instantiate ip helper
+    ipr = IPRoute()
 
+    # most frames moved per pump pass, before it re-checks its source
+    batch_size = 64
+
+    def __init__(
+        self, tb, raw: bool = True, debug_sample: int = 64,
+        prefix: str = "tap", ports: list[int] | None = None,
+        queues: int = 1
+    ):
+        """
+        Parameters
+        ----------
+        tb: TB
+            The testbench, for access to the DUT's MACs
+
+        raw: bool = True
+            Shuttle bare `bytes` between the TAP fds and the MACs,
+            rather than dissecting/rebuilding every frame with scapy
+
+        debug_sample: int = 64
+            In raw mode, with debug logging on, only every n-th frame gets
+            parsed by scapy and logged (0 disables it altogether)
+
+        prefix: str = "tap"
+            TAP devices are named `{prefix}{k}`, where k indexes `tb.port_mac`;
+            any that already exist (e.g. from `Topology.basic_net(taps=N)`)
+            are attached to, rather than created
+
+        ports: list[int] | None = None
+            Which entries of `tb.port_mac` to bridge, defaults to all of them
+
+        queues: int = 1
+            Make each TAP multi-queue, with this many queues: the host kernel
+            then spreads its flows across them, each with its own reader
+            (and pump), and frames from the DUT are spread by flow hash
+        """
+        # attach to the tesbench (for access to DUT)
+        self.tb = tb
 
-    async def serve_mac(self):
-        # TODO: rewrite this code to work for all interfaces
-        iface = self.tb.driver.interfaces[0]
+        self.raw = raw
+        self.debug_sample = debug_sample
+
+        if ports is None:
+            ports = list(range(len(tb.port_mac)))
+
+        # one TAP device per MAC, each drained in the background
+        self.ports: list[TAPPort] = []
+        self.pumps: list[Pump] = []
+        for k in ports:
+            tap = Tap(devname=f"{prefix}{k}", no_ip=True, queues=queues)
+            tap.start_reader(raw=raw)
+            port = TAPPort(k, tap, tb.port_mac[k])
+            self.ports.append(port)
+
+            # get the servers up and running, independently for every port
+            # (and TAP queue). the TAP side is fed by host threads, so it
+            # can't wake us up: those pumps back off while idle, instead
+            for q in range(queues):
+                self.pumps.append(Pump(
+                    f"tap{k}->dut" if queues == 1 else f"tap{k}q{q}->dut",
+                    lambda tap=tap, q=q: tap.recv_nowait(q),
+                    lambda pkt, port=port, q=q: self.serve_tap(port, pkt, q),
+                    batch_size=self.batch_size
+                ).start())
+            self.pumps.append(Pump(
+                f"dut->tap{k}", lambda mac=port.mac: _tx_recv_nowait(mac),
+                lambda frame, port=port: self.serve_mac(port, frame),
+                wait=port.mac.tx.wait, batch_size=self.batch_size
+            ).start())
+
+            self.tb.log.info(
+                "TAPServer[%d]: bridging %s to the DUT", k, tap.dev
+            )
+
+
+    async def serve_tap(self, port: TAPPort, packet, queue: int = 0):
+        """Inject a frame from (one of the queues of) the port's TAP into the DUT"""
+        recorder = self.tb.driver.recorder
+        port.to_dut_queue_frames[queue] += 1
+
+        if self.raw:
+            # EthMacRx.send wraps raw bytes in an EthMacFrame for us
+            port.to_dut_frames += 1
+            port.to_dut_bytes += len(packet)
+            if recorder is not None:
+                recorder.record(port.tap.dev, packet, recorder.DIR_IN, queue)
+            if self._sampled(port.to_dut_frames):
+                self.tb.log.debug(
+                    "<CORYSUMMARY> TAPServer.serve_tap[%d]: "
+                    "Got a frame! - %r", port.index, Ether(packet)
+                )
+            await port.mac.rx.send(packet)
+            return
 
-        self.tb.log.info("TAPServer.serve_mac: Listening for packet...")
+        self.tb.log.debug(
+            f"<CORYSUMMARY> TAPServer.serve_tap[{port.index}]: "
+            f"Got a frame! - {packet!r}"
+        )
 
-        frame = await self.tb.port_mac[iface.index*iface.port_count].tx.recv()
+        # EthMacRx.send actually wraps raw bytes in EthMacFrame for us!
+        # its constructor also safely transfers data from one EMF to
+        # another, so I'm wrapping it just in case a cosmic ray makes it
+        # skip that line...
+        frame = EthMacFrame(packet.build())
+        port.to_dut_frames += 1
+        port.to_dut_bytes += len(frame.data)
+        if recorder is not None:
+            recorder.record(port.tap.dev, frame.data, recorder.DIR_IN, queue)
+
+        # back-to-back: the MAC model paces these at line rate anyway
+        await port.mac.rx.send(frame)
+
+
+    async def serve_mac(self, port: TAPPort, frame: EthMacFrame):
+        """Forward a frame the DUT transmitted on this port to its TAP"""
+        port.to_host_frames += 1
+        port.to_host_bytes += len(frame.data)
+
+        # keep each flow on one queue, so the host never sees it reordered
+        queue = 0
+        if port.tap.queues > 1:
+            queue = flow_hash(frame.data) % port.tap.queues
+        port.to_host_queue_frames[queue] += 1
+
+        recorder = self.tb.driver.recorder
+        if recorder is not None:
+            recorder.record(port.tap.dev, frame.data, recorder.DIR_OUT, queue)
+
+        if self.raw:
+            data = bytes(frame.data)
+            port.tap.send_raw(data, queue)
+
+            if self._sampled(port.to_host_frames):
+                self.tb.log.debug(
+                    "<CORYSUMMARY> TAPServer.serve_mac[%d]: Sent frame - %r",
+                    port.index, Ether(data)
+                )
+            return
 
         self.tb.log.info(
-            f"<CORYSUMMARY> TAPServer.serve_mac: Got a frame - {frame}"
+            f"<CORYSUMMARY> TAPServer.serve_mac[{port.index}]: "
+            f"Got a frame - {frame}"
         )
 
         # extract payload from their L2 frame, then wrap with a scapy L2 header
         eth_frame = Ether(frame.data)
-        self.tap.send(eth_frame)
+        port.tap.send(eth_frame, queue)
 
         self.tb.log.info(
-            f"<CORYSUMMARY> TAPServer.serve_mac: Sent frame - {eth_frame!r}"
+            f"<CORYSUMMARY> TAPServer.serve_mac[{port.index}]: "
+            f"Sent frame - {eth_frame!r}"
         )
 
-    async def _serve_tap(self):
-        """wrapping serve_tap so it'll run 'til the test comes crumbling down"""
-        while True:
-            await self.serve_tap()
-            await Timer(Decimal(12), 'us')
-
-    async def _serve_mac(self):
-        """wrapping serve_tap so it'll run 'til the cows come home"""
-        while True:
-            await self.serve_mac()
-            await Timer(Decimal(2), 'us')
+    def get_stats(self) -> list[dict]:
+        """per-port throughput counters, see `TAPPort.get_stats`"""
+        return [port.get_stats() for port in self.ports]
+
+    def log_stats(self):
+        for st in self.get_stats():
+            self.tb.log.info(
+                "TAPServer[%d] (%s): to DUT %d frames / %.3f Gbps, "
+                "to host %d frames / %.3f Gbps",
+                st["port"], st["dev"],
+                st["to_dut_frames"], st["to_dut_gbps"],
+                st["to_host_frames"], st["to_host_gbps"]
+            )
+            if len(st["to_dut_queue_frames"]) > 1:
+                self.tb.log.info(
+                    "TAPServer[%d] (%s): per queue, to DUT %s, to host %s",
+                    st["port"], st["dev"],
+                    st["to_dut_queue_frames"], st["to_host_queue_frames"]
+                )
+        for pump in self.pumps:
+            self.tb.log.info(
+                "TAPServer pump %s: %d frames, %.0f pps (sim)",
+                pump.name, pump.count, pump.get_rate()
+            )
+
+    def _sampled(self, count: int) -> bool:
+        """should this frame be dissected by scapy, purely for the logs?"""
+        return (
+            self.debug_sample > 0
+            and (count - 1) % self.debug_sample == 0
+            and self.tb.log.isEnabledFor(logging.DEBUG)
+        )
+
+
+def _tx_recv_nowait(mac) -> EthMacFrame | None:
+    """EthMacTx.recv_nowait raises on an empty queue, Pump wants a None"""
+    if mac.tx.empty():
+        return None
+    return mac.tx.recv_nowait()
 
 
 class FaucetServer:
@@ -19,8 +19,10 @@ from scapy.layers.l2 import Ether
 from scapy.layers.inet import IP, UDP
 
 import cocotb
-from cocotb.triggers import RisingEdge, Timer
+from cocotb.triggers import Event, RisingEdge, Timer, with_timeout
+from cocotb.utils import get_sim_time
 
+from corunlib.payload import HeaderTemplate, payload, payloads
 from corunlib.testbench import TB
 
 # Note: just importing the fn allows cocotb to reach out and access the test fn
@@ -40,7 +42,9 @@ except ImportError:
 
 
 @contextmanager
-def loopback_enabled(tb: TB, enabled: bool = True):
+def loopback_enabled(
+    tb: TB, enabled: bool = True, wiring: dict[int, int] | None = None
+):
     """temporary loopback enabling utility
 
     Parameters
@@ -50,6 +54,10 @@ def loopback_enabled(tb: TB, enabled: bool = True):
     enabled: bool
         should loopback be enabled?
         this option is useful for parameterised testing
+    wiring: dict[int, int] | None = None
+        which ports to loop, as {TX port: RX port}, e.g. {0: 1} sends
+        everything port 0 transmits into port 1's receiver;
+        by default, every port is looped back onto itself
 
     Returns
     -------
@@ -63,7 +71,11 @@ def loopback_enabled(tb: TB, enabled: bool = True):
         ...
     ```
     """
-    tb.loopback_enable = enabled
+    if enabled and wiring is not None:
+        for src, dst in wiring.items():
+            tb.set_loopback(src, dst)
+    else:
+        tb.loopback_enable = enabled
 
     # go back to context body
     yield enabled
@@ -71,6 +83,45 @@ def loopback_enabled(tb: TB, enabled: bool = True):
     tb.loopback_enable = False
 
 
+@contextmanager
+def rx_zero_copy(interface: mqnic.Interface, enabled: bool = True):
+    """temporary zero-copy receive utility
+
+    On the way out (however that happens), the interface's previous mode is
+    restored, and any zero-copy packets still waiting in its receive queue are
+    detached (copied out), so their buffers go back to the driver,
+    rather than leaking for want of a consumer that knows to `release()` them
+
+    Parameters
+    ----------
+    interface: mqnic.Interface
+        the interface whose receive path should (not) hand out DMA buffer views
+    enabled: bool
+        should zero-copy receive be enabled?
+        this option is useful for parameterised testing
+
+    Usage
+    -----
+    ```
+    with rx_zero_copy(interface):
+        pkt = await interface.recv()
+        with pkt:
+            ...
+    ```
+    """
+    previous = interface.rx_zero_copy
+    interface.rx_zero_copy = enabled
+
+    try:
+        yield enabled
+    finally:
+        interface.rx_zero_copy = previous
+
+        if not previous:
+            for pkt in interface.pkt_rx_queue:
+                pkt.detach()
+
+
 # abstract multiple tests into this one heavily-parameterised function
 async def simple_packet_firehose(
     tb: TB, interface: mqnic.Interface, count: int = 0, size: int = 0,
@@ -78,7 +129,7 @@ async def simple_packet_firehose(
     csum_start: int | None = None, csum_offset: int | None = None,
     header_stack: Packet | None = None,
     data: list[bytearray] | None = None, assert_data: bool = True,
-    queues: set[int] | None = None
+    queues: set[int] | None = None, zero_copy: bool = False
 ):
     """Send different configurations of packet barrages over desired interface
 
@@ -132,6 +183,10 @@ async def simple_packet_firehose(
     queues: set[int] | None = None
         pass a set to be informed of which queues, packets have been recevied at
 
+    zero_copy: bool = False
+        receive packets as views over the driver's DMA buffers,
+        rather than copying every frame out of host memory
+
     Usage
     -----
     ```python
@@ -156,6 +211,7 @@ async def simple_packet_firehose(
     -----------
     - `header_stack` cannot use variable values, e.g. IP ranges, port ranges
         - workaround is to build variable headered packets outside
+          (see `corunlib.payload.HeaderTemplate`),
           then pass them in using the `data` kwarg
 
     DESIGNED FOR THIS:
@@ -177,21 +233,24 @@ async def simple_packet_firehose(
         recv()
         assert
     ```
+
+    for overlapping TX/RX (e.g. sustained-load tests),
+    see `pipelined_firehose`
     """
     if data is None:
-        data = [
-            bytearray([(x+k) % 256 for x in range(size)]) for k in range(count)
-        ]
+        data = payloads(count, size)
 
     if header_stack is None:
         pkts = data
     else:
-        pkts = [(header_stack / payload).build() for payload in data]
+        # scapy builds the headers once, not once per packet
+        template = HeaderTemplate(header_stack)
+        pkts = [template.build(p) for p in data]
 
     # commence firehosing
-    with loopback_enabled(tb, enable_loopback):
-        for pkt in pkts:
-            await interface.start_xmit(pkt, tx_ring, csum_start, csum_offset)
+    with rx_zero_copy(interface, zero_copy), loopback_enabled(tb, enable_loopback):
+        # post the whole barrage, ringing the doorbell once (not per packet)
+        await interface.start_xmit_batch(pkts, tx_ring, csum_start, csum_offset)
 
         for k in range(count):
             pkt = await interface.recv()
@@ -199,22 +258,220 @@ async def simple_packet_firehose(
             if pkt is None:
                 raise ValueError("Packet is None")
 
-            tb.log.info("Packet: %s", pkt)
+            # gives the buffer back to the driver, pass or fail
+            # (no-op if it was a copy)
+            with pkt:
+                tb.log.debug("Packet: %s", pkt)
 
-            if assert_data:
-                assert pkt.data == pkts[k]
+                if assert_data:
+                    assert pkt.data == pkts[k]
 
-            if interface.if_feature_rx_csum:
-                assert pkt.rx_checksum == ~scapy.utils.checksum(
-                    bytes(pkt.data[14:])
-                ) & 0xffff
+                if interface.if_feature_rx_csum:
+                    assert pkt.rx_checksum == ~scapy.utils.checksum(
+                        bytes(pkt.data[14:])
+                    ) & 0xffff
 
-            if queues is not None:
-                queues.add(pkt.queue)
+                if queues is not None:
+                    queues.add(pkt.queue)
 
     return queues
 
 
+async def pipelined_firehose(
+    tb: TB, interface: mqnic.Interface, count: int, size: int,
+    window: int = 32, tx_ring: int = 0, enable_loopback: bool = True,
+    csum_start: int | None = None, csum_offset: int | None = None,
+    assert_data: bool = True, queues: set[int] | None = None,
+    zero_copy: bool = False, tag_offset: int = 14,
+    timeout: Decimal | None = None
+) -> dict:
+    """Sustained-load firehose: TX and RX run concurrently, window-limited
+
+    Unlike `simple_packet_firehose`, sending and receiving overlap: a TX
+    coroutine keeps up to `window` packets in flight, while an RX coroutine
+    matches whatever comes back to what was sent, by a sequence tag written
+    into each packet, so out-of-order arrivals (e.g. across RSS queues)
+    are fine.
+
+    Parameters
+    ----------
+    tb: TB
+        the testbench instance being used for the testing
+
+    interface: mqnic.Interface
+        the interface that you would like to firehose packets from
+
+    count: int
+        how many packets should be sent?
+
+    size: int
+        and how large do you want those packets?
+        must have room for the sequence tag, at `tag_offset`
+
+    window: int = 32
+        most packets in flight (sent, but not yet received) at once
+
+    tx_ring: int = 0
+        which transmission ring would you like to use?
+
+    enable_loopback: bool = True
+        should automatic MAC loopback be enabled?
+
+    csum_start: int | None = None
+        as in `simple_packet_firehose`
+
+    csum_offset: int | None = None
+        as in `simple_packet_firehose`
+
+    assert_data: bool = True
+        do you want to assert that each received packet == the one sent?
+
+    queues: set[int] | None = None
+        pass a set to be informed of which queues, packets have been recevied at
+
+    zero_copy: bool = False
+        receive packets as views over the driver's DMA buffers
+
+    tag_offset: int = 14
+        where the 4-byte (big-endian) sequence tag goes in each packet,
+        by default, right after the Ethernet header
+
+    timeout: Decimal | None = None
+        give up (raising `cocotb.result.SimTimeoutError`) if the whole run
+        takes longer than this (in ns) of sim time, rather than hanging
+
+    Returns
+    -------
+    stats: dict
+        packet count, elapsed sim time, throughput,
+        per-packet latency (min/mean/p99/max, in ns),
+        and how many packets arrived out of order
+
+    Usage
+    -----
+    ```python
+    stats = await pipelined_firehose(
+        tb, tb.driver.interfaces[0], 4096, 1514, window=64
+    )
+    ```
+    """
+    if size < tag_offset + 4:
+        raise ValueError(
+            f"{size}B packets have no room for a sequence tag at {tag_offset}"
+        )
+
+    # seq -> (packet, sim time it was posted)
+    in_flight: dict[int, tuple[bytearray, int]] = {}
+    space = Event()
+    latencies = []
+    out_of_order = 0
+
+    def make_pkt(seq):
+        pkt = bytearray(payload(size, seq))
+        struct.pack_into("!L", pkt, tag_offset, seq)
+        return pkt
+
+    async def tx():
+        seq = 0
+        while seq < count:
+            room = window - len(in_flight)
+            if room <= 0:
+                space.clear()
+                await space.wait()
+                continue
+
+            burst = [make_pkt(s) for s in range(seq, min(seq + room, count))]
+            now = get_sim_time('ns')
+            for s, pkt in enumerate(burst, seq):
+                in_flight[s] = (pkt, now)
+            seq += len(burst)
+
+            # one doorbell per burst
+            await interface.start_xmit_batch(
+                burst, tx_ring, csum_start, csum_offset
+            )
+
+    async def rx():
+        nonlocal out_of_order
+        expected = 0
+
+        for _ in range(count):
+            pkt = await interface.recv()
+
+            if pkt is None:
+                raise ValueError("Packet is None")
+
+            # gives the buffer back to the driver, pass or fail
+            with pkt:
+                tb.log.debug("Packet: %s", pkt)
+
+                (seq,) = struct.unpack_from("!L", pkt.data, tag_offset)
+                sent = in_flight.pop(seq, None)
+                assert sent is not None, f"unexpected (or duplicate) packet {seq}"
+
+                latencies.append(get_sim_time('ns') - sent[1])
+
+                if seq != expected:
+                    out_of_order += 1
+                expected = seq + 1
+
+                if assert_data:
+                    assert pkt.data == sent[0]
+
+                if interface.if_feature_rx_csum:
+                    assert pkt.rx_checksum == ~scapy.utils.checksum(
+                        bytes(pkt.data[14:])
+                    ) & 0xffff
+
+                if queues is not None:
+                    queues.add(pkt.queue)
+
+            space.set()
+
+    with loopback_enabled(tb, enable_loopback):
+        start = get_sim_time('ns')
+
+        # rx_zero_copy puts the mode back (and detaches anything still
+        # queued) however this ends, timeouts and failed asserts included
+        with rx_zero_copy(interface, zero_copy):
+            tx_task = cocotb.start_soon(tx())
+            try:
+                if timeout is None:
+                    await rx()
+                else:
+                    await with_timeout(rx(), timeout, 'ns')
+            finally:
+                tx_task.kill()
+                in_flight.clear()
+
+        elapsed = get_sim_time('ns') - start
+
+    latencies.sort()
+    stats = {
+        "count": count,
+        "elapsed_ns": elapsed,
+        "pps": count * 1e9 / elapsed if elapsed else 0.0,
+        "gbps": count * size * 8 / elapsed if elapsed else 0.0,
+        "latency_min_ns": latencies[0] if latencies else 0,
+        "latency_mean_ns": sum(latencies) / len(latencies) if latencies else 0,
+        "latency_p99_ns": (
+            latencies[int(0.99 * (len(latencies) - 1))] if latencies else 0
+        ),
+        "latency_max_ns": latencies[-1] if latencies else 0,
+        "out_of_order": out_of_order,
+    }
+
+    tb.log.info(
+        "pipelined firehose: %d x %dB, window %d: %.3f Gbps (sim), "
+        "latency min/mean/p99/max %d/%.0f/%d/%d ns, %d out of order",
+        count, size, window, stats["gbps"],
+        stats["latency_min_ns"], stats["latency_mean_ns"],
+        stats["latency_p99_ns"], stats["latency_max_ns"], out_of_order
+    )
+
+    return stats
+
+
 async def dma_bench_test(tb: TB):
     """
     Just the DMA bench test extracted from\\
@@ -531,25 +788,26 @@ async def queue_map_offset_test(tb: TB):
 async def q_map_rss_mask_test(tb: TB):
     await tb.driver.interfaces[0].set_rx_queue_map_rss_mask(0, 0x00000003)
 
-    for k in range(4):
-        await tb.driver.interfaces[0].set_rx_queue_map_indir_table(0, k, k)
+    await tb.driver.interfaces[0].write_rx_queue_map_indir_table(0, range(4))
 
     pkts = []
     count = 64
 
-    payload = bytes([x % 256 for x in range(256)])
+    payload = payloads(1, 256)[0]
     eth = Ether(src='5A:51:52:53:54:55', dst='DA:D1:D2:D3:D4:D5')
     ip = IP(src='192.168.1.100', dst='192.168.1.101')
+    template = HeaderTemplate(eth / ip / UDP(sport=1, dport=0))
 
     for k in range(count):
-        udp = UDP(sport=1, dport=k+0)
-        test_pkt = eth / ip / udp / payload
+        test_pkt = template.build(payload, dport=k)
 
         if tb.driver.interfaces[0].if_feature_tx_csum:
-            test_pkt = test_pkt.copy()
-            test_pkt[UDP].chksum = scapy.utils.checksum(bytes(test_pkt[UDP]))
+            # UDP header starts at 34, its checksum at 34 + 6
+            struct.pack_into(
+                "!H", test_pkt, 40, scapy.utils.checksum(bytes(test_pkt[34:]))
+            )
 
-        pkts.append(test_pkt.build())
+        pkts.append(test_pkt)
 
     csum_start, csum_offset = None, None
     if tb.driver.interfaces[0].if_feature_tx_csum:
@@ -573,7 +831,7 @@ async def q_map_rss_mask_test(tb: TB):
 async def all_interfaces_test(tb):
     count = 64
 
-    pkts = [bytearray([(x+k) % 256 for x in range(1514)]) for k in range(count)]
+    pkts = payloads(count, 1514)
 
     with loopback_enabled(tb):
         for k, p in enumerate(pkts):
@@ -585,7 +843,7 @@ async def all_interfaces_test(tb):
             if pkt is None:
                 raise ValueError("Packet is None")
 
-            tb.log.info("Packet: %s", pkt)
+            tb.log.debug("Packet: %s", pkt)
 
             assert pkt.data == pkts[k]
 
@@ -599,18 +857,18 @@ async def all_scheduler_blocks_test(tb: TB, interface: mqnic.Interface):
     for block in interface.sched_blocks:
         await block.schedulers[0].rb.write_dword(mqnic.MQNIC_RB_SCHED_RR_REG_CTRL, 0x00000001)
         await block.interface.set_rx_queue_map_indir_table(block.index, 0, block.index)
-        for k in range(len(block.interface.txq)):
-            if k % len(block.interface.sched_blocks) == block.index:
-                await block.schedulers[0].hw_regs.write_dword(4*k, 0x00000003)
-            else:
-                await block.schedulers[0].hw_regs.write_dword(4*k, 0x00000000)
+        async with mqnic.PostedWrites(block.schedulers[0].hw_regs) as regs:
+            regs.write_dwords(0, [
+                0x00000003 if k % len(block.interface.sched_blocks) == block.index else 0x00000000
+                for k in range(len(block.interface.txq))
+            ])
 
         await block.interface.ports[block.index].set_tx_ctrl(mqnic.MQNIC_PORT_TX_CTRL_EN)
         await block.interface.ports[block.index].set_rx_ctrl(mqnic.MQNIC_PORT_RX_CTRL_EN)
 
     count = 64
 
-    pkts = [bytearray([(x+k) % 256 for x in range(1514)]) for k in range(count)]
+    pkts = payloads(count, 1514)
 
     with loopback_enabled(tb):
         queues = set()
@@ -624,7 +882,7 @@ async def all_scheduler_blocks_test(tb: TB, interface: mqnic.Interface):
             if pkt is None:
                 raise ValueError("Packet is None")
 
-            tb.log.info("Packet: %s", pkt)
+            tb.log.debug("Packet: %s", pkt)
             # assert pkt.data == pkts[k]
             if interface.if_feature_rx_csum:
                 assert pkt.rx_checksum == ~scapy.utils.checksum(bytes(pkt.data[14:])) & 0xffff
@@ -656,101 +914,115 @@ async def lfc_pause_frame_receiver_test(tb: TB, interface: mqnic.Interface):
     await simple_packet_firehose(tb, interface, 16, 1514)
 
 
-@cocotb.test
-async def full_nic_test(dut):
-    # Initialise TestBench DUT instance
-    tb = TB(dut, msix_count=2**len(dut.core_pcie_inst.irq_index))
-
-    await tb.init()
-
-    tb.log.info("Init driver")
-    if (device := tb.rc.find_device(tb.dev.functions[0].pcie_id)) is not None:
-        await tb.driver.init_pcie_dev(device)
-    for interface in tb.driver.interfaces:
-        await interface.open()
-
-    # enable queues
-    tb.log.info("Enable queues")
-    for interface in tb.driver.interfaces:
-        await interface.sched_blocks[0].schedulers[0].rb.write_dword(mqnic.MQNIC_RB_SCHED_RR_REG_CTRL, 0x00000001)
-        for k in range(len(interface.txq)):
-            await interface.sched_blocks[0].schedulers[0].hw_regs.write_dword(4*k, 0x00000003)
-
-    # wait for all writes to complete
-    await tb.driver.hw_regs.read_dword(0)
-    tb.log.info("Init complete")
-
-    # -------------------- All iface, single packet test --------------------
+# --------------------------- Sub-tests ---------------------------
+# each of these is run in sequence by full_nic_test, or on its own, as a
+# separate cocotb test (with its own simulator), when sharding is on
 
+async def single_packet_all_test(tb: TB):
     tb.log.info("Send and receive single packet")
 
     for interface in tb.driver.interfaces:
         await single_packet_test(tb, interface)
 
-    # -------------------- Basic Rx/Tx Checksum Test --------------------
 
+async def checksum_test(tb: TB):
     tb.log.info("RX and TX checksum tests")
 
     await basic_checksum_test(tb)
 
-    # -------------------- Queue Mapping Offset Test --------------------
 
+async def queue_map_test(tb: TB):
     tb.log.info("Queue mapping offset test")
 
     await queue_map_offset_test(tb)
 
-    # -------------------- Queue mapping RSS mask test --------------------
 
+async def rss_mask_test(tb: TB):
     if tb.driver.interfaces[0].if_feature_rss:
         tb.log.info("Queue mapping RSS mask test")
 
         await q_map_rss_mask_test(tb)
 
-    # -------------------- Packet test: Many Small --------------------
 
+async def small_packets_test(tb: TB):
     tb.log.info("Multiple small packets")
 
     await simple_packet_firehose(tb, tb.driver.interfaces[0], 64, 60)
 
-    # -------------------- Packet test: Many Large --------------------
 
+async def large_packets_test(tb: TB):
     tb.log.info("Multiple large packets")
 
     await simple_packet_firehose(tb, tb.driver.interfaces[0], 64, 1514)
 
-    # -------------------- Packet test: Many Huge --------------------
 
+async def jumbo_frames_test(tb: TB):
     tb.log.info("Jumbo frames")
 
-    await simple_packet_firehose(tb, tb.driver.interfaces[0], 64, 9014)
+    # the big frames are where copying every one out of host memory hurts
+    await simple_packet_firehose(
+        tb, tb.driver.interfaces[0], 64, 9014, zero_copy=True
+    )
+
+
+async def napi_test(tb: TB):
+    tb.log.info("NAPI-style interrupt polling")
 
-    # ---------------- Packet test: To all interfaces ----------------
+    driver = tb.driver
+    count = 64
+
+    before = driver.get_irq_stats()
+
+    driver.napi_budget = 8
+    try:
+        await simple_packet_firehose(tb, driver.interfaces[0], count, 1514)
+    finally:
+        driver.napi_budget = None
+
+    after = driver.get_irq_stats()
+    irqs, events, cpls = (after[k] - before[k] for k in ("irqs", "events", "completions"))
+
+    tb.log.info(
+        "NAPI: %d completions over %d events, %d interrupts (%.1f per interrupt)",
+        cpls, events, irqs, cpls / irqs if irqs else 0.0
+    )
+
+    assert irqs > 0
+    # at least every received packet, (most of) the TX completions on top
+    assert cpls >= count
 
+
+async def pipelined_test(tb: TB):
+    tb.log.info("Pipelined firehose, sustained load")
+
+    await pipelined_firehose(
+        tb, tb.driver.interfaces[0], 1024, 1514, window=32,
+        timeout=Decimal(10_000_000)
+    )
+
+
+async def interfaces_test(tb: TB):
     if len(tb.driver.interfaces) > 1:
         tb.log.info("All interfaces")
 
         await all_interfaces_test(tb)
 
-    # ------------ All Scheduler Blocks Test: Interface 0 ------------
 
+async def scheduler_blocks_test(tb: TB):
     if len(tb.driver.interfaces[0].sched_blocks) > 1:
         tb.log.info("All interface 0 scheduler blocks")
 
         await all_scheduler_blocks_test(tb, tb.driver.interfaces[0])
 
-    # ------------------- Rx under paused LFC Test -------------------
 
+async def lfc_test(tb: TB):
     if tb.driver.interfaces[0].if_feature_lfc:
         tb.log.info("Test LFC pause frame RX")
 
         await lfc_pause_frame_receiver_test(tb, tb.driver.interfaces[0])
 
-    # -------------------- Another kind of test --------------------
-
-    await dma_bench_test(tb)
-
-    # ------------------------- Read Stats -------------------------
 
+async def read_stats_test(tb: TB):
     tb.log.info("Read statistics counters")
 
     await Timer(Decimal(2000), 'ns')
@@ -762,16 +1034,85 @@ async def full_nic_test(dut):
 
     print(lst)
 
-    # ---------------- AXI Lite -> App interface Test ----------------
 
+async def axil_app_test(tb: TB):
     tb.log.info("Test AXI lite interface to application")
 
     await tb.driver.app_hw_regs.write_dword(0, 0x11223344)
 
     print(await tb.driver.app_hw_regs.read_dword(0))
 
+
+# (name, sub-test), in the order full_nic_test runs them (bar SHARD_ONLY);
+# as separate cocotb tests, these are called `nic_{name}`
+NIC_SUBTESTS = [
+    ("single_packet", single_packet_all_test),
+    ("checksum", checksum_test),
+    ("queue_map", queue_map_test),
+    ("rss_mask", rss_mask_test),
+    ("small_packets", small_packets_test),
+    ("large_packets", large_packets_test),
+    ("jumbo_frames", jumbo_frames_test),
+    ("napi", napi_test),
+    ("pipelined", pipelined_test),
+    ("all_interfaces", interfaces_test),
+    ("scheduler_blocks", scheduler_blocks_test),
+    ("lfc", lfc_test),
+    ("dma_bench", dma_bench_test),
+    ("read_stats", read_stats_test),
+    ("axil_app", axil_app_test),
+]
+
+# with TALC_SHARD set, each sub-test runs as its own cocotb test (see
+# run_regression.py), otherwise they all run back-to-back in full_nic_test
+SHARDED = bool(os.environ.get("TALC_SHARD"))
+
+# too long for full_nic_test, these only run as their own shard
+SHARD_ONLY = {"pipelined"}
+
+
+async def nic_bring_up(dut) -> TB:
+    """common fixture: a TB with the driver up and all queues enabled"""
+    # Initialise TestBench DUT instance
+    tb = TB(dut, msix_count=2**len(dut.core_pcie_inst.irq_index))
+
+    await tb.bring_up()
+
+    tb.log.info("Init complete")
+
+    return tb
+
+
+@cocotb.test(skip=SHARDED)
+async def full_nic_test(dut):
+    tb = await nic_bring_up(dut)
+
+    for name, subtest in NIC_SUBTESTS:
+        if name not in SHARD_ONLY:
+            await subtest(tb)
+
     await RisingEdge(dut.clk)
     await RisingEdge(dut.clk)
 
 
+def _nic_shard(name, subtest):
+    async def shard(dut):
+        tb = await nic_bring_up(dut)
+
+        await subtest(tb)
+
+        await RisingEdge(dut.clk)
+        await RisingEdge(dut.clk)
+
+    # cocotb names tests after their function
+    shard.__name__ = shard.__qualname__ = f"nic_{name}"
+    shard.__doc__ = f"{name}, on a freshly brought-up NIC"
+
+    return cocotb.test(skip=not SHARDED)(shard)
+
+
+for _name, _subtest in NIC_SUBTESTS:
+    globals()[f"nic_{_name}"] = _nic_shard(_name, _subtest)
+
+
 # cocotb-test
@@ -1,17 +1,33 @@
 from option import Result, Ok, Err
+from dataclasses import dataclass
+from itertools import groupby
+from operator import itemgetter
 from subprocess import CompletedProcess
+from typing import Callable
+import json
+import shlex
+import socket
 import subprocess
+import time
+
+from netlib.rtnl import (
+    ARPHRD_ETHER, ARPHRD_NAMES, IFF_NAMES, IFF_UP, RTNL,
+    RTMGRP_IPV4_IFADDR, RTMGRP_IPV6_IFADDR, RTMGRP_LINK, event_index,
+)
 
 
 class IPRoute:
     """A wrapper for the ip toolset (i.e. you need it installed on your system)
 
-    literally just runs the ip command given...\n
+    The common operations (link show/set up|down, addr add/del, and
+    `get_link_info`/`get_addr_info`) are done natively, over one persistent rtnetlink
+    socket (see `netlib.rtnl`), everything else runs the ip command given,
+    as an argv list (never through a shell).\n
     Warning: cannot run any sudo commands,
     unless you have python installed under root
 
     i.e. never ever expose this API to anyone that you wouldn't 100%
-    trust to enter arbitrary commands on your device :D
+    trust to run `ip` on your device :D
 
     But I think it's a nice wrapper, that:
     - is simple to use
@@ -25,44 +41,67 @@ class IPRoute:
     Note: currently only supports more readable `.addr` and `.link`,
     use `.ip` for all other commands (or those, too, if you want...)
     """
-    def __init__(self):
-        out = self._run_cmd("ip -V")
+    def __init__(self, netns: str | None = None, cache_ttl: float = 5.0):
+        """Nothing is opened or run 'til the first command, so this is free
+
+        Parameters
+        ----------
+        netns: str | None = None
+            run everything inside this (named) network namespace,
+            i.e. `ip -n {netns} ...`
+
+        cache_ttl: float = 5.0
+            how long (in seconds) `get_link_info` results are trusted for;
+            only really matters if netlink notifications aren't available,
+            otherwise any change to a link evicts it straight away
+        """
+        self.netns = netns
+        self.cache_ttl = cache_ttl
 
-        if out.is_err:
-            raise RuntimeError(
-                f"""err (ipr): I think ip utility isn't installed,
-                here's the error:\n{out.unwrap_err()}"""
-            )
+        # opened on first use; False if netlink isn't available to us
+        self._rtnl: RTNL | None | bool = None
+        self._monitor: RTNL | None | bool = None
 
-        # all good to go :)
+        # devname -> (expiry time, info)
+        self._cache: dict[str, tuple[float, LinkInfo]] = {}
 
-    def _sanitiser(self, *args: str) -> Result[None, str]:
-        """
-        Very unsophisticated command sanitiser, before being passed to bash
+    @property
+    def rtnl(self) -> RTNL | None:
+        """the rtnetlink socket, or None if we have to fork `ip` instead"""
+        if self._rtnl is None:
+            try:
+                self._rtnl = RTNL(self.netns)
+            except OSError:
+                self._rtnl = False
 
-        For more secure use, I recommend implementing whitelisting
-        """
-        blacklist = (';', '|', '&&')
-        for arg in args:
-            for taboo in blacklist:
-                if taboo in arg:
-                    return Err(taboo)
+        return self._rtnl or None
 
-        return Ok(None)
+    def _argv(self, *cmds: str, as_root: bool = False) -> list[str]:
+        """the full `ip` argv, e.g. `["ip", "link", "set", "tap0", "up"]`"""
+        argv = ["sudo", "ip"] if as_root else ["ip"]
+        if self.netns is not None:
+            argv += ["-n", self.netns]
 
+        return argv + _split(cmds)
 
-    def _run_cmd(self, cmd: str) -> Result[CompletedProcess[str], str]:
-        """literally just runs the command given...
+    def _run_cmd(
+        self, argv: list[str], stdin: str | None = None
+    ) -> Result[CompletedProcess[str], str]:
+        """runs the command given, no shell involved
 
         But also raises error on failed command, etc.
-
-        i.e. never ever expose this API to anyone that you wouldn't 100%
-        trust to enter arbitrary commands on your device :D
         """
-        out = subprocess.run(
-            cmd.strip(), shell=True,
-            capture_output=True, text=True, encoding='utf-8'
-        )
+        cmd = ' '.join(argv)
+        try:
+            out = subprocess.run(
+                argv, input=stdin,
+                capture_output=True, text=True, encoding='utf-8'
+            )
+        except FileNotFoundError as e:
+            return Err(
+                f"err (ipr): I think {argv[0]} isn't installed, "
+                f"here's the error:\n{e}"
+            )
 
         if out.returncode == 0:
             return Ok(out)
@@ -73,6 +112,40 @@ class IPRoute:
                 """  # have to do it like this for the formatting...
             )
 
+    def _native(
+        self, argv: list[str], op: Callable[[RTNL], str]
+    ) -> Result[CompletedProcess[str], str]:
+        """run `op` over netlink, dressed up as if `argv` had been run"""
+        try:
+            stdout = op(self.rtnl)
+        except OSError as e:
+            return Err(
+                f"err (ipr): command '{' '.join(argv)}' failed:\n  {e}"
+            )
+
+        return Ok(CompletedProcess(argv, 0, stdout, ""))
+
+    def _native_link(self, args: list[str]) -> Callable[[RTNL], str] | None:
+        """the netlink equivalent of `ip link {args}`, if there is one"""
+        match args:
+            case ["show", dev] | ["show", "dev", dev]:
+                return lambda rtnl: _format_link(rtnl.link_get(dev))
+            case ["set", dev, ("up" | "down") as state] \
+                    | ["set", "dev", dev, ("up" | "down") as state]:
+                return lambda rtnl: rtnl.link_set(dev, state == "up") or ""
+
+        return None
+
+    def _native_addr(self, args: list[str]) -> Callable[[RTNL], str] | None:
+        """the netlink equivalent of `ip addr {args}`, if there is one"""
+        match args:
+            case ["add", prefix, "dev", dev]:
+                return lambda rtnl: rtnl.addr_add(dev, prefix) or ""
+            case ["del", prefix, "dev", dev]:
+                return lambda rtnl: rtnl.addr_del(dev, prefix) or ""
+
+        return None
+
     def addr(
         self, *cmds: str, as_root: bool = False
     ) -> Result[CompletedProcess[str], str]:
@@ -115,16 +188,14 @@ class IPRoute:
         team_slave | vcan | veth | vlan | vrf | vti | vxcan | vxlan | wwan |
         xfrm | virt_wifi }
         """
-        out = self._sanitiser(*cmds)
-        if out.is_err:
-            return Err(
-                "err (ipr): disallowed string,"
-                + f"'{out.unwrap_err()}', in devname..."
-            )
+        argv = self._argv("addr", *cmds, as_root=as_root)
 
-        return self._run_cmd(
-            ("sudo" if as_root else "")+ f"ip addr {' '.join(cmds)}"
-        )
+        # sudo needs the real thing, else try to skip the fork
+        op = None if as_root else self._native_addr(_split(cmds))
+        if op is not None and self.rtnl is not None:
+            return self._native(argv, op)
+
+        return self._run_cmd(argv)
 
     def link(
         self, *cmds: str, as_root: bool = False
@@ -181,16 +252,14 @@ class IPRoute:
         team_slave | vcan | veth | vlan | vrf | vti | vxcan | vxlan | wwan |
         xfrm | virt_wifi }
         """
-        out = self._sanitiser(*cmds)
-        if out.is_err:
-            return Err(
-                "err (ipr): disallowed string,"
-                + f"'{out.unwrap_err()}', in devname..."
-            )
+        argv = self._argv("link", *cmds, as_root=as_root)
 
-        return self._run_cmd(
-            ("sudo" if as_root else "")+ f"ip link {' '.join(cmds)}"
-        )
+        # sudo needs the real thing, else try to skip the fork
+        op = None if as_root else self._native_link(_split(cmds))
+        if op is not None and self.rtnl is not None:
+            return self._native(argv, op)
+
+        return self._run_cmd(argv)
 
     def ip(
         self, *cmds: str, as_root: bool = False
@@ -214,163 +283,333 @@ class IPRoute:
         -t[imestamp] | -ts[hort] | -b[atch] [filename] | -rc[vbuf] [size] |
         -n[etns] name | -N[umeric] | -a[ll] | -c[olor]}
         """
-        out = self._sanitiser(*cmds)
-        if out.is_err:
-            return Err(
-                "err (ipr): disallowed string,"
-                + f"'{out.unwrap_err()}', in devname..."
-            )
-        return self._run_cmd(
-            ("sudo" if as_root else "")+ f"ip {' '.join(cmds)}"
-        )
+        # `ip link ...`/`ip addr ...` might not need a fork at all
+        match _split(cmds):
+            case ["link", *rest]:
+                return self.link(*map(shlex.quote, rest), as_root=as_root)
+            case ["addr" | "address", *rest]:
+                return self.addr(*map(shlex.quote, rest), as_root=as_root)
+
+        return self._run_cmd(self._argv(*cmds, as_root=as_root))
+
+
+    def batch(self, as_root: bool = False, force: bool = False) -> "IPBatch":
+        """Collect up `ip` commands, to apply them all in one go
+
+        Usage
+        -----
+        ```python
+        with ipr.batch() as b:
+            b.link("add br0 type bridge")
+            b.link("set br0 up")
+            b.ip("netns add nsc")
+            b.addr("add 10.0.0.2/24 dev veth-c", netns="nsc")
+        ```
+        see `IPBatch`
+        """
+        return IPBatch(self, as_root=as_root, force=force)
 
+    def invalidate(self, devname: str | None = None):
+        """drop `devname` (or everything) from the link info cache"""
+        if devname is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(devname, None)
+
+    def _drop_stale(self):
+        """apply any link/addr notifications that have come in since last time"""
+        if self._monitor is None:
+            try:
+                self._monitor = RTNL(
+                    self.netns,
+                    groups=RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR
+                )
+            except OSError:
+                self._monitor = False  # the TTL will have to do
+
+        if not self._monitor:
+            return
 
-    def _parse_ip_addr_dev(
-        self, lines: list[list[str]]
-    ) -> dict[str, list[dict]]:
-        """internal function to parse the output of 'ip addr show {dev}'"""
-        existing_items = dict()
-
-        info = dict()
-        for line in lines:
-            count = len(line)
-            if count == 0:
-                continue
-
-            match line[0]:
-                case "link/ether":
-                    scrutinee = line[0]
-                    if scrutinee not in existing_items:
-                        existing_items[scrutinee] = 0
-                        info["eth"] = list()
-                    else:
-                        existing_items[scrutinee] += 1
-
-                    info["eth"].append(dict())
-                    idx = existing_items[scrutinee]
-
-                    info["eth"][idx]["addr"] = line[1]
-
-                    if count < 3:
-                        continue
-
-                    i = 2
-                    while i < count:
-                        match line[i]:
-                            case "brd":
-                                info["eth"][idx]["brd"] = line[i+1]
-                                i += 1
-                            case _:
-                                pass
-                        i += 1
-
-                case "inet":
-                    scrutinee = line[0]
-                    if scrutinee not in existing_items:
-                        existing_items[scrutinee] = 0
-                        info["ip"] = list()
-                    else:
-                        existing_items[scrutinee] += 1
-
-                    info["ip"].append(dict())
-                    idx = existing_items[scrutinee]
-
-                    addr_mask = line[1].split('/')
-                    match len(addr_mask):
-                        case 1:
-                            info["ip"][idx]["addr"] = addr_mask[0]
-                        case 2:
-                            info["ip"][idx]["addr"] = addr_mask[0]
-                            info["ip"][idx]["mask"] = addr_mask[1]
-                        case _:
-                            raise ValueError(
-                                f"err (ipr): what is this? {addr_mask}"
-                            )
-
-                    if count < 3:
-                        continue
-
-                    i = 2
-                    while i < count:
-                        match line[i]:
-                            case "brd":
-                                info["ip"][idx]["brd"] = line[i+1]
-                                i += 1
-                            case "scope":
-                                info["ip"][idx]["scope"] = line[i+1]
-                                i += 1
-                            case _:
-                                pass
-                        i += 1
-
-                case "inet6":
-                    scrutinee = line[0]
-                    if scrutinee not in existing_items:
-                        existing_items[scrutinee] = 0
-                        info["ip6"] = list()
-                    else:
-                        existing_items[scrutinee] += 1
-
-                    info["ip6"].append(dict())
-                    idx = existing_items[scrutinee]
-
-                    addr_mask = line[1].split('/')
-                    match len(addr_mask):
-                        case 1:
-                            info["ip6"][idx]["addr"] = addr_mask[0]
-                        case 2:
-                            info["ip6"][idx]["addr"] = addr_mask[0]
-                            info["ip6"][idx]["mask"] = addr_mask[1]
-                        case _:
-                            raise ValueError(
-                                f"err (ipr): what is this? {addr_mask}"
-                            )
-
-                    if count < 3:
-                        continue
-
-                    i = 2
-                    while i < count:
-                        match line[i]:
-                            case "brd":
-                                info["ip6"][idx]["brd"] = line[i+1]
-                                i += 1
-                            case "scope":
-                                info["ip6"][idx]["scope"] = line[i+1]
-                                i += 1
-                            case _:
-                                pass
-                        i += 1
+        try:
+            events = self._monitor.recv_events()
+        except OSError:  # ENOBUFS: missed some, so trust nothing
+            self._cache.clear()
+            return
+
+        changed = {event_index(*event) for event in events}
+        if changed:
+            for name, (_, link) in list(self._cache.items()):
+                if link.index in changed:
+                    del self._cache[name]
+
+    def get_link_info(self, devname: str = "eth0") -> "LinkInfo":
+        """Gets `devname`'s link details, and all of its addresses
+
+        Served from a cache, which is kept up to date by netlink
+        notifications (or, failing that, expires after `cache_ttl` seconds),
+        so calling this a lot is fine.
+
+        Raises
+        ------
+        RuntimeError
+            if there's no such device (or we couldn't ask)
+        ValueError
+            if `ip -j`'s output couldn't be made sense of
+        """
+        self._drop_stale()
+
+        cached = self._cache.get(devname)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        if self.rtnl is not None:
+            try:
+                link = LinkInfo.from_rtnl(self.rtnl, devname)
+            except OSError as e:
+                raise RuntimeError(
+                    f"err (ipr): failed to get info for '{devname}':\n{e}"
+                )
+        else:
+            argv = self._argv("-j", "addr", "show", "dev", devname)
+            out = self._run_cmd(argv)
+            if out.is_err:
+                raise RuntimeError(
+                    f"err (ipr): failed to run '{' '.join(argv)}':\n"
+                    f"{out.unwrap_err()}"
+                )
+
+            try:
+                link = LinkInfo.from_json(json.loads(out.unwrap().stdout)[0])
+            except (ValueError, KeyError, IndexError) as e:
+                raise ValueError(
+                    f"err (ipr): failed to parse output of "
+                    f"'{' '.join(argv)}' \n{e!r}"
+                )
+
+        self._cache[devname] = (time.monotonic() + self.cache_ttl, link)
+        return link
 
-        return info
+    def get_addr_info(self, devname: str = "eth0") -> dict:
+        """Gets `devname`'s link and IP addresses, as a dict:
+        `{"eth": [{addr, brd}], "ip": [{addr, mask, brd, scope}], "ip6": [...]}`
+        (keys without any entries are left out, as are absent fields)
 
+        Just `get_link_info`, in the shape this used to return
+        """
+        return self.get_link_info(devname).to_dict()
 
-    def get_addr_info(self, devname: str = "eth0") -> dict:
-        """Runs 'ip addr show {devname}' and parses the output into a dict"""
 
-        out = self._sanitiser(devname)
-        if out.is_err:
-            raise RuntimeError(
-                "err (ipr): disallowed string,"
-                + f"'{out.unwrap_err()}', in devname..."
+class IPBatch:
+    """A list of `ip` commands, run through `ip -batch` rather than one by one
+
+    Each run of consecutive commands in the same namespace becomes one
+    `ip [-n NETNS] -batch -` process, so a whole topology costs a handful
+    of forks, rather than one per command.
+    Applied when the `with` block exits (raising RuntimeError if that fails),
+    or whenever `apply` is called.
+    """
+
+    def __init__(self, ipr: IPRoute, as_root: bool = False, force: bool = False):
+        """
+        Parameters
+        ----------
+        ipr: IPRoute
+            commands default to this one's namespace
+
+        as_root: bool = False
+            run `sudo ip ...`
+
+        force: bool = False
+            keep going past failed commands (`ip -force`),
+            instead of stopping at the first one
+        """
+        self.ipr = ipr
+        self.as_root = as_root
+        self.force = force
+
+        # (netns, batch line)
+        self.lines: list[tuple[str | None, str]] = []
+
+    def ip(self, *cmds: str, netns: str | None = None) -> "IPBatch":
+        """queue up `ip {cmds}` (in `netns`, if given)"""
+        words = _split(cmds)
+        # ip's batch parser understands double quotes, not shell escapes
+        line = " ".join(
+            f'"{w}"' if not w or any(c.isspace() for c in w) else w
+            for w in words
+        )
+        self.lines.append((netns if netns is not None else self.ipr.netns, line))
+        return self
+
+    def link(self, *cmds: str, netns: str | None = None) -> "IPBatch":
+        return self.ip("link", *cmds, netns=netns)
+
+    def addr(self, *cmds: str, netns: str | None = None) -> "IPBatch":
+        return self.ip("addr", *cmds, netns=netns)
+
+    def apply(self) -> Result[list[CompletedProcess[str]], str]:
+        """run (and then forget) everything queued up so far"""
+        results = []
+        for netns, group in groupby(self.lines, key=itemgetter(0)):
+            argv = ["sudo", "ip"] if self.as_root else ["ip"]
+            if netns is not None:
+                argv += ["-n", netns]
+            if self.force:
+                argv.append("-force")
+            argv += ["-batch", "-"]
+
+            out = self.ipr._run_cmd(
+                argv, stdin="".join(f"{line}\n" for _, line in group)
             )
+            if out.is_err:
+                return out
+            results.append(out.unwrap())
 
-        cmd = f"ip addr show {devname}"
+        self.lines.clear()
 
-        out = self._run_cmd(cmd)
+        # the world may well look different now
+        self.ipr.invalidate()
+
+        return Ok(results)
+
+    def __enter__(self) -> "IPBatch":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            return  # don't half-apply anything
+
+        out = self.apply()
         if out.is_err:
-            raise RuntimeError(
-                f"err (ipr): failed to run '{cmd}':\n{out.unwrap_err()}"
-            )
+            raise RuntimeError(out.unwrap_err())
+
+
+@dataclass(frozen=True)
+class AddrInfo:
+    """One IP address on a link"""
+    family: int  # socket.AF_INET or socket.AF_INET6
+    address: str
+    prefixlen: int
+    scope: str
+    broadcast: str | None = None
+    label: str | None = None
+
+    @property
+    def is_ipv4(self) -> bool:
+        return self.family == socket.AF_INET
+
+    @classmethod
+    def from_json(cls, info: dict) -> "AddrInfo":
+        """from one of `ip -j addr`'s addr_info entries"""
+        return cls(
+            family=socket.AF_INET if info["family"] == "inet" else socket.AF_INET6,
+            address=info["local"],
+            prefixlen=info["prefixlen"],
+            scope=str(info.get("scope", "global")),
+            broadcast=info.get("broadcast"),
+            label=info.get("label"),
+        )
 
-        # I'm really banking on the output for `ip addr` being consistent...
-        lines = [  # split by line, then split line by spaces
-            line.strip().split() for line in out.unwrap().stdout.split('\n')
-        ]
 
-        try:
-            return self._parse_ip_addr_dev(lines)
-        except ValueError as e:
-            raise ValueError(
-                f"err (ipr): failed to parse output of '{cmd}' \n{e}"
-            )
+@dataclass(frozen=True)
+class LinkInfo:
+    """A link, as `ip addr show` would describe it"""
+    index: int
+    name: str
+    flags: int  # IFF_*
+    link_type: str  # e.g. "ether", "loopback"
+    mtu: int | None = None
+    operstate: str | None = None
+    address: str | None = None
+    broadcast: str | None = None
+    addrs: tuple[AddrInfo, ...] = ()
+
+    @property
+    def up(self) -> bool:
+        return bool(self.flags & IFF_UP)
+
+    @property
+    def ipv4(self) -> list[AddrInfo]:
+        return [a for a in self.addrs if a.is_ipv4]
+
+    @property
+    def ipv6(self) -> list[AddrInfo]:
+        return [a for a in self.addrs if not a.is_ipv4]
+
+    @classmethod
+    def from_rtnl(cls, rtnl: RTNL, devname: str) -> "LinkInfo":
+        link = rtnl.link_get(devname)
+        return cls(
+            index=link["index"],
+            name=link["name"],
+            flags=link["flags"],
+            link_type=ARPHRD_NAMES.get(link["type"], str(link["type"])),
+            mtu=link["mtu"],
+            operstate=link["operstate"],
+            address=link["address"],
+            broadcast=link["broadcast"],
+            addrs=tuple(
+                AddrInfo(
+                    family=a["family"], address=a["address"],
+                    prefixlen=a["prefixlen"], scope=a["scope"],
+                    broadcast=a["broadcast"], label=a["label"],
+                )
+                for a in rtnl.addr_dump(link["index"])
+            ),
+        )
+
+    @classmethod
+    def from_json(cls, info: dict) -> "LinkInfo":
+        """from one entry of `ip -j addr show`"""
+        flag_bits = {name: flag for flag, name in IFF_NAMES.items()}
+        return cls(
+            index=info["ifindex"],
+            name=info["ifname"],
+            flags=sum(flag_bits.get(f, 0) for f in info.get("flags", [])),
+            link_type=info.get("link_type", "none"),
+            mtu=info.get("mtu"),
+            operstate=info.get("operstate"),
+            address=info.get("address"),
+            broadcast=info.get("broadcast"),
+            addrs=tuple(
+                AddrInfo.from_json(a) for a in info.get("addr_info", [])
+                if a.get("family") in ("inet", "inet6")
+            ),
+        )
+
+    def to_dict(self) -> dict[str, list[dict]]:
+        """the old `get_addr_info` dict"""
+        info: dict[str, list[dict]] = {}
+        if self.link_type == "ether" and self.address is not None:
+            eth = {"addr": self.address}
+            if self.broadcast is not None:
+                eth["brd"] = self.broadcast
+            info["eth"] = [eth]
+
+        for addr in self.addrs:
+            entry = {"addr": addr.address, "mask": str(addr.prefixlen)}
+            if addr.broadcast is not None:
+                entry["brd"] = addr.broadcast
+            entry["scope"] = addr.scope
+            info.setdefault("ip" if addr.is_ipv4 else "ip6", []).append(entry)
+
+        return info
+
+
+def _split(cmds: tuple[str, ...]) -> list[str]:
+    """each of `cmds` may hold several (shell-style) words"""
+    return [word for cmd in cmds for word in shlex.split(cmd)]
+
+
+def _format_link(link: dict) -> str:
+    """roughly what `ip link show` would've printed"""
+    flags = ",".join(
+        name for flag, name in IFF_NAMES.items() if link["flags"] & flag
+    )
+    # unknown types come out as their number, like `ip` does
+    kind = ARPHRD_NAMES.get(link["type"], f"[{link['type']}]")
+    return (
+        f"{link['index']}: {link['name']}: <{flags}> mtu {link['mtu']} "
+        f"state {link['operstate']}\n"
+        f"    link/{kind} {link['address']} brd {link['broadcast']}\n"
+    )
@@ -0,0 +1,411 @@
+"""
+A tiny rtnetlink client, for the handful of `ip` operations we do a lot of
+
+Only covers what the testbed actually needs (links up/down, addresses
+add/del/dump, link lookups), over one persistent NETLINK_ROUTE socket,
+so none of those need a fork+exec of `ip` any more.
+Anything fancier should still go through `IPRoute.ip`.
+
+Linux only, obviously; needs CAP_NET_ADMIN for anything that changes state.
+"""
+
+from pathlib import Path
+import ctypes
+import errno
+import ipaddress
+import os
+import socket
+import struct
+import threading
+
+
+NETLINK_ROUTE = 0
+
+# message types
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+
+# multicast groups, for notification sockets
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+
+# message flags
+NLM_F_REQUEST = 0x1
+NLM_F_MULTI = 0x2
+NLM_F_ACK = 0x4
+NLM_F_DUMP = 0x300
+NLM_F_EXCL = 0x200
+NLM_F_CREATE = 0x400
+
+# link attributes
+IFLA_ADDRESS = 1
+IFLA_BROADCAST = 2
+IFLA_IFNAME = 3
+IFLA_MTU = 4
+IFLA_MASTER = 10
+IFLA_OPERSTATE = 16
+
+# address attributes
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_LABEL = 3
+IFA_BROADCAST = 4
+
+IFF_UP = 0x1
+IFF_BROADCAST = 0x2
+IFF_LOOPBACK = 0x8
+IFF_POINTOPOINT = 0x10
+IFF_NOARP = 0x80
+IFF_PROMISC = 0x100
+IFF_MULTICAST = 0x1000
+IFF_LOWER_UP = 0x10000
+
+# in the order `ip link` prints them
+IFF_NAMES = {
+    IFF_LOOPBACK: "LOOPBACK", IFF_BROADCAST: "BROADCAST",
+    IFF_POINTOPOINT: "POINTOPOINT", IFF_MULTICAST: "MULTICAST",
+    IFF_NOARP: "NOARP", IFF_PROMISC: "PROMISC",
+    IFF_UP: "UP", IFF_LOWER_UP: "LOWER_UP",
+}
+
+ARPHRD_ETHER = 1
+ARPHRD_LOOPBACK = 772
+ARPHRD_NONE = 0xFFFE
+
+# as `ip -j` names them
+ARPHRD_NAMES = {
+    ARPHRD_ETHER: "ether", ARPHRD_LOOPBACK: "loopback", ARPHRD_NONE: "none",
+}
+
+CLONE_NEWNET = 0x40000000
+
+NETNS_RUN_DIR = Path("/run/netns")
+
+_NLMSGHDR = struct.Struct("=LHHLL")
+_IFINFOMSG = struct.Struct("=BxHiII")
+_IFADDRMSG = struct.Struct("=BBBBI")
+_RTATTR = struct.Struct("=HH")
+
+SCOPES = {0: "global", 200: "site", 253: "link", 254: "host", 255: "nowhere"}
+OPERSTATES = {
+    0: "UNKNOWN", 1: "NOTPRESENT", 2: "DOWN", 3: "LOWERLAYERDOWN",
+    4: "TESTING", 5: "DORMANT", 6: "UP",
+}
+
+
+class NetlinkError(OSError):
+    """The kernel NACKed a request"""
+
+
+def _align(n: int) -> int:
+    return (n + 3) & ~3
+
+
+def _attr(attr_type: int, value: bytes) -> bytes:
+    length = _RTATTR.size + len(value)
+    return (
+        _RTATTR.pack(length, attr_type) + value + bytes(_align(length) - length)
+    )
+
+
+def _parse_attrs(data: bytes | memoryview) -> dict[int, bytes]:
+    attrs = {}
+    offset = 0
+    while offset + _RTATTR.size <= len(data):
+        length, attr_type = _RTATTR.unpack_from(data, offset)
+        if length < _RTATTR.size:
+            break
+        attrs[attr_type] = bytes(data[offset+_RTATTR.size:offset+length])
+        offset += _align(length)
+    return attrs
+
+
+def _mac(raw: bytes | None) -> str | None:
+    return None if raw is None else ":".join(f"{b:02x}" for b in raw)
+
+
+def _setns(fd: int):
+    """`os.setns` only turned up in Python 3.12"""
+    if hasattr(os, "setns"):
+        os.setns(fd, CLONE_NEWNET)
+        return
+
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.setns(fd, CLONE_NEWNET) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+
+def parse_link(msg: bytes) -> dict:
+    """an RTM_NEWLINK payload, as a dict"""
+    _, link_type, index, flags, _ = _IFINFOMSG.unpack_from(msg)
+    attrs = _parse_attrs(memoryview(msg)[_IFINFOMSG.size:])
+
+    mtu = attrs.get(IFLA_MTU)
+    master = attrs.get(IFLA_MASTER)
+    operstate = attrs.get(IFLA_OPERSTATE)
+    return {
+        "index": index,
+        "type": link_type,
+        "name": attrs.get(IFLA_IFNAME, b"").rstrip(b"\0").decode(),
+        "flags": flags,
+        "up": bool(flags & IFF_UP),
+        "mtu": None if mtu is None else struct.unpack("=I", mtu)[0],
+        "address": _mac(attrs.get(IFLA_ADDRESS)),
+        "broadcast": _mac(attrs.get(IFLA_BROADCAST)),
+        "master": None if master is None else struct.unpack("=I", master)[0],
+        "operstate": (
+            None if operstate is None else OPERSTATES.get(operstate[0], "UNKNOWN")
+        ),
+    }
+
+
+def event_index(msg_type: int, msg: bytes) -> int | None:
+    """which link a link/addr notification is about"""
+    if msg_type in (RTM_NEWLINK, RTM_DELLINK):
+        return _IFINFOMSG.unpack_from(msg)[2]
+    if msg_type in (RTM_NEWADDR, RTM_DELADDR):
+        return _IFADDRMSG.unpack_from(msg)[4]
+    return None
+
+
+def parse_addr(msg: bytes) -> dict:
+    """an RTM_NEWADDR payload, as a dict"""
+    family, prefixlen, flags, scope, index = _IFADDRMSG.unpack_from(msg)
+    attrs = _parse_attrs(memoryview(msg)[_IFADDRMSG.size:])
+
+    def ip(raw):
+        return None if raw is None else socket.inet_ntop(family, raw)
+
+    # for IPv4, IFA_LOCAL is the interface's own address (IFA_ADDRESS is the
+    # peer's, on point-to-point links); IPv6 only bothers with IFA_ADDRESS
+    return {
+        "index": index,
+        "family": family,
+        "prefixlen": prefixlen,
+        "flags": flags,
+        "scope": SCOPES.get(scope, str(scope)),
+        "address": ip(attrs.get(IFA_LOCAL, attrs.get(IFA_ADDRESS))),
+        "broadcast": ip(attrs.get(IFA_BROADCAST)),
+        "label": (
+            attrs[IFA_LABEL].rstrip(b"\0").decode()
+            if IFA_LABEL in attrs else None
+        ),
+    }
+
+
+class RTNL:
+    """One persistent rtnetlink socket, optionally inside a network namespace"""
+
+    def __init__(self, netns: str | None = None, groups: int = 0):
+        """
+        Parameters
+        ----------
+        netns: str | None = None
+            a named network namespace (as in `ip netns`) to operate in;
+            the socket stays bound to it, even after we switch back
+
+        groups: int = 0
+            RTMGRP_* multicast groups to subscribe to, making this a
+            (non-blocking) notification socket, see `recv_events`
+
+        Raises
+        ------
+        OSError
+            if the socket couldn't be opened (or the namespace entered)
+        """
+        self.netns = netns
+        self._seq = 0
+        self._lock = threading.Lock()
+
+        if netns is None:
+            self.sock = self._open(groups)
+            return
+
+        # setns only moves the calling thread, so hop in, open, and hop back
+        own = os.open("/proc/thread-self/ns/net", os.O_RDONLY)
+        target = os.open(NETNS_RUN_DIR / netns, os.O_RDONLY)
+        try:
+            _setns(target)
+            try:
+                self.sock = self._open(groups)
+            finally:
+                _setns(own)
+        finally:
+            os.close(target)
+            os.close(own)
+
+    @staticmethod
+    def _open(groups: int) -> socket.socket:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        sock.bind((0, groups))
+        if groups:
+            sock.setblocking(False)
+        return sock
+
+    def close(self):
+        self.sock.close()
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    def _request(
+        self, msg_type: int, flags: int, body: bytes
+    ) -> list[tuple[int, bytes]]:
+        """send one request, collect every reply 'til the ACK/DONE
+
+        Returns
+        -------
+        list[tuple[int, bytes]]
+            (message type, payload) for each reply (not including the ACK)
+
+        Raises
+        ------
+        NetlinkError
+            if the kernel sent back an error
+        """
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+
+            header = _NLMSGHDR.pack(
+                _NLMSGHDR.size + len(body), msg_type,
+                flags | NLM_F_REQUEST | NLM_F_ACK, seq, 0
+            )
+            self.sock.send(header + body)
+
+            replies = []
+            while True:
+                data = self.sock.recv(65536)
+                offset = 0
+                while offset + _NLMSGHDR.size <= len(data):
+                    length, reply_type, _, reply_seq, _ = \
+                        _NLMSGHDR.unpack_from(data, offset)
+                    payload = data[offset+_NLMSGHDR.size:offset+length]
+                    offset += _align(length)
+
+                    if reply_seq != seq:
+                        continue  # a straggler from an earlier request
+
+                    if reply_type == NLMSG_DONE:
+                        return replies
+
+                    if reply_type == NLMSG_ERROR:
+                        (error,) = struct.unpack_from("=i", payload)
+                        if error == 0:  # just the ACK
+                            return replies
+                        raise NetlinkError(-error, os.strerror(-error))
+
+                    replies.append((reply_type, payload))
+
+    def recv_events(self) -> list[tuple[int, bytes]]:
+        """every notification waiting on a `groups` socket, without blocking
+
+        Returns
+        -------
+        list[tuple[int, bytes]]
+            (message type, payload) for each, e.g. (RTM_NEWADDR, ifaddrmsg...)
+
+        Raises
+        ------
+        OSError
+            ENOBUFS, if the kernel had to drop some (we fell too far behind)
+        """
+        events = []
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except BlockingIOError:
+                return events
+
+            offset = 0
+            while offset + _NLMSGHDR.size <= len(data):
+                length, msg_type, _, _, _ = _NLMSGHDR.unpack_from(data, offset)
+                events.append(
+                    (msg_type, data[offset+_NLMSGHDR.size:offset+length])
+                )
+                offset += _align(length)
+
+    # -------------------------------- links --------------------------------
+
+    def link_get(self, name: str) -> dict:
+        """look a link up by name
+
+        Raises
+        ------
+        NetlinkError
+            ENODEV, if there's no such device
+        """
+        body = _IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        body += _attr(IFLA_IFNAME, name.encode() + b"\0")
+
+        for msg_type, payload in self._request(RTM_GETLINK, 0, body):
+            if msg_type == RTM_NEWLINK:
+                return parse_link(payload)
+
+        raise NetlinkError(errno.ENODEV, os.strerror(errno.ENODEV))
+
+    def link_dump(self) -> list[dict]:
+        body = _IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        return [
+            parse_link(payload)
+            for msg_type, payload in self._request(RTM_GETLINK, NLM_F_DUMP, body)
+            if msg_type == RTM_NEWLINK
+        ]
+
+    def link_set(self, name: str, up: bool):
+        """`ip link set {name} up|down`"""
+        index = self.link_get(name)["index"]
+        body = _IFINFOMSG.pack(
+            socket.AF_UNSPEC, 0, index, IFF_UP if up else 0, IFF_UP
+        )
+        self._request(RTM_NEWLINK, 0, body)
+
+    # ------------------------------ addresses ------------------------------
+
+    def _addr_msg(self, name: str, prefix: str) -> bytes:
+        iface = ipaddress.ip_interface(prefix)
+        family = socket.AF_INET if iface.version == 4 else socket.AF_INET6
+        index = self.link_get(name)["index"]
+        packed = iface.ip.packed
+
+        body = _IFADDRMSG.pack(family, iface.network.prefixlen, 0, 0, index)
+        body += _attr(IFA_LOCAL, packed)
+        body += _attr(IFA_ADDRESS, packed)
+        return body
+
+    def addr_add(self, name: str, prefix: str):
+        """`ip addr add {prefix} dev {name}`, e.g. prefix="10.0.0.1/24"
+
+        Raises
+        ------
+        NetlinkError
+            EEXIST, if it's already there
+        """
+        self._request(
+            RTM_NEWADDR, NLM_F_CREATE | NLM_F_EXCL, self._addr_msg(name, prefix)
+        )
+
+    def addr_del(self, name: str, prefix: str):
+        """`ip addr del {prefix} dev {name}`"""
+        self._request(RTM_DELADDR, 0, self._addr_msg(name, prefix))
+
+    def addr_dump(self, index: int | None = None) -> list[dict]:
+        """every address (of every family), optionally just for one link"""
+        body = _IFADDRMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        addrs = [
+            parse_addr(payload)
+            for msg_type, payload in self._request(RTM_GETADDR, NLM_F_DUMP, body)
+            if msg_type == RTM_NEWADDR
+        ]
+        if index is not None:
+            # without strict checking, the kernel ignores the index filter
+            addrs = [a for a in addrs if a["index"] == index]
+        return addrs
@@ -1,15 +1,38 @@
+from scapy.layers.l2 import Ether
 from scapy.layers.tuntap import TunTapInterface
-from scapy.sendrecv import sendp, srp, srp1
+from scapy.sendrecv import srp, srp1
 
 from scapy.packet import Packet
 
 from pathlib import Path
+import fcntl
+import os
+import queue
+import select
+import socket
+import struct
 import subprocess
+import threading
 
 from netlib.iproute import IPRoute
 
 ipr = IPRoute()
 
+# big enough for any frame the kernel will hand us (jumbo frames included)
+RAW_READ_SIZE = 65536
+
+# headroom on top of the MTU, for `recv_many`'s buffers: Ethernet + VLAN tag
+FRAME_OVERHEAD = 18
+
+# from linux/if_tun.h, for multi-queue devices (which scapy can't make)
+TUNSETIFF = 0x400454ca
+IFF_TAP = 0x0002
+IFF_MULTI_QUEUE = 0x0100
+IFF_PERSIST = 0x0800
+IFF_NO_PI = 0x1000
+
+SYS_CLASS_NET = Path("/sys/class/net")
+
 class UsageError(BaseException): ...
 
 # TODO: if there's time, separate this class into 2 sub-classes:
@@ -20,10 +43,15 @@ class Tap:
     def __init__(
         self, devname: str = "tap0", is_client: bool = False,
         no_ip: bool = False, ip_addr: str = "10.0.0.1", mask: int = 24,
-        no_su: bool = False, config_script: Path = Path("")
+        no_su: bool = False, config_script: Path = Path(""),
+        queues: int = 1
     ):
         """Either create and setup or attach to existing tap interface
 
+        A non-client attaching to an existing (persistent) TAP, e.g. one made
+        by `netlib.topology.Topology`, takes it as it is: no IP, no link
+        config, just its fd(s), opened with the device's own flags
+
         Parameters
         ----------
         devname: str = "tap0"
@@ -71,23 +99,59 @@ class Tap:
         sudo ip link set $devname up
         sudo ip addr add 10.0.0.1/24 dev $devname
             ```
+
+        queues: int = 1
+            How many queues (i.e. fds) the device should have;
+            more than 1 makes it an IFF_MULTI_QUEUE device,
+            with the kernel spreading outgoing flows across the queues,
+            see `start_reader` and `send_raw`.
+            An existing device must already be multi-queue, for more than 1
         """
         self.dev = devname
         self.is_client = is_client
+        self.queues = queues
+
+        # background reader state (one queue + thread per fd),
+        # see `start_reader`
+        self._rx_queues: list[queue.Queue[Packet | bytes]] = [
+            queue.Queue() for _ in range(queues)
+        ]
+        self._readers: list[threading.Thread] = []
+        self._reader_stop = threading.Event()
+        self._next_queue = 0
+
+        # frames read/written, per queue
+        self.rx_frames = [0] * queues
+        self.tx_frames = [0] * queues
+
+        # `recv_many`'s preallocated buffers (one pool per queue),
+        # and the size of each slot in them
+        self._pools: list[bytearray | None] = [None] * queues
+        self._slot_size = 0
+
+        # clients send through a (persistent) packet socket, see `_client_sock`
+        self._sock: socket.socket | None = None
 
         # check if this device already exists
         out = ipr.link("show", self.dev)
         if out.is_ok:
             if is_client:
                 print(f"Device '{self.dev}' already exists, using that...")
-                return
             else:
-                raise RuntimeError(
-                    f"err (tap): Device '{self.dev}' already exists!"
-                )
+                self._attach()
+            return
 
         # instantiate our wrapped tap device :D
-        self.tap = TunTapInterface(devname, mode_tun=False)
+        if queues > 1:
+            # scapy only does single-queue, so these are bare fds
+            self.tap = None
+            self.fds = [
+                _open_tap(devname, IFF_TAP | IFF_NO_PI | IFF_MULTI_QUEUE)
+                for _ in range(queues)
+            ]
+        else:
+            self.tap = TunTapInterface(devname, mode_tun=False)
+            self.fds = [self.tap.fileno()]
 
         # set device up, and give it an ip address?
         if no_su:
@@ -123,28 +187,345 @@ class Tap:
                 return
 
 
+    def _attach(self):
+        """open fds on an existing, persistent TAP device
+
+        Raises
+        ------
+        RuntimeError
+            if it isn't a TAP, or isn't multi-queue when we want more than 1
+        """
+        flags_file = SYS_CLASS_NET / self.dev / "tun_flags"
+        if not flags_file.exists():
+            raise RuntimeError(
+                f"err (tap): Device '{self.dev}' already exists, "
+                "and isn't a TUN/TAP device!"
+            )
+
+        # TUNSETIFF wants the same feature flags the device was made with
+        flags = int(flags_file.read_text(), 16) & ~IFF_PERSIST
+        if not flags & IFF_TAP:
+            raise RuntimeError(f"err (tap): Device '{self.dev}' is a TUN, not a TAP")
+        if self.queues > 1 and not flags & IFF_MULTI_QUEUE:
+            raise RuntimeError(
+                f"err (tap): Device '{self.dev}' isn't multi-queue, "
+                f"can't attach {self.queues} queues"
+            )
+
+        print(f"Device '{self.dev}' already exists, attaching to it...")
+
+        # bare fds, since scapy insists on its own flags
+        self.tap = None
+        self.fds = [_open_tap(self.dev, flags) for _ in range(self.queues)]
+
     def listen(self):
         """listens to the TAP, until it receives a packet"""
         if self.is_client:
             raise UsageError("err (tap): a client instance may not listen")
 
+        if self.tap is None:
+            # multi-queue: just wait on the first queue
+            return Ether(os.read(self.fds[0], RAW_READ_SIZE))
+
         packet = None
         while packet is None:
             packet = self.tap.recv()
 
         return packet
 
-    def send(self, packet: Packet):
+    def start_reader(self, timeout: float = 0.1, raw: bool = False):
+        """Start draining the TAP in the background, one thread per queue
+
+        Each fd is switched to non-blocking and watched with `select`; whenever
+        it becomes readable, every pending frame is read and pushed onto that
+        queue's internal queue, to be collected with `poll`/`recv_nowait`.
+        This means nobody on the cocotb side ever has to block on the TAP.
+
+        Parameters
+        ----------
+        timeout: float = 0.1
+            How long (in seconds) each `select` may wait before re-checking
+            whether the reader has been asked to stop
+
+        raw: bool = False
+            Queue up the raw frame `bytes`, instead of scapy `Packet`s,
+            skipping scapy's dissection entirely
+        """
+        if self.is_client:
+            raise UsageError("err (tap): a client instance may not listen")
+        if self._readers:
+            return
+
+        self._reader_stop.clear()
+        for q, fd in enumerate(self.fds):
+            # scapy's recv() just returns None on EAGAIN, so this is safe
+            os.set_blocking(fd, False)
+
+            reader = threading.Thread(
+                target=self._read_loop, args=(q, timeout, raw),
+                name=f"tap-reader-{self.dev}-q{q}", daemon=True
+            )
+            reader.start()
+            self._readers.append(reader)
+
+    def stop_reader(self):
+        """Stop the background readers, if they're running"""
+        if not self._readers:
+            return
+
+        self._reader_stop.set()
+        for reader in self._readers:
+            reader.join()
+        self._readers = []
+
+    def _read_loop(self, q: int, timeout: float, raw: bool):
+        fd = self.fds[q]
+        rx_queue = self._rx_queues[q]
+
+        if raw:
+            def recv():
+                return self.recv_raw(q)
+        elif self.tap is not None:
+            recv = self.tap.recv
+        else:
+            def recv():
+                data = self.recv_raw(q)
+                return None if data is None else Ether(data)
+
+        while not self._reader_stop.is_set():
+            readable, _, _ = select.select([fd], [], [], timeout)
+            if not readable:
+                continue
+
+            # drain everything that's there, not just the first frame
+            while (packet := recv()) is not None:
+                self.rx_frames[q] += 1
+                rx_queue.put(packet)
+
+    def recv_raw(self, queue: int = 0) -> bytes | None:
+        """Read a single frame straight off the TAP fd, no scapy involved
+
+        Parameters
+        ----------
+        queue: int = 0
+            which of the device's queues to read from
+
+        Returns
+        -------
+        bytes | None
+            The bare Ethernet frame, or None if the (non-blocking) fd had
+            nothing to give
+        """
+        if self.is_client:
+            raise UsageError("err (tap): a client instance may not listen")
+
+        try:
+            return os.read(self.fds[queue], RAW_READ_SIZE)
+        except BlockingIOError:
+            return None
+
+    def send_raw(self, data: bytes, queue: int = 0):
+        """Write a single frame straight to the TAP fd, no scapy involved
+
+        Parameters
+        ----------
+        data: bytes
+            the bare Ethernet frame you wish to send to the TAP interface
+
+        queue: int = 0
+            which of the device's queues to send it through;
+            keep each flow on one queue (see `netlib.utils.flow_hash`),
+            or the host may see it reordered
+        """
+        if self.is_client:
+            self._client_sock().send(data)
+        else:
+            os.write(self.fds[queue], data)
+        self.tx_frames[queue] += 1
+
+    def send_many(self, frames, queue: int = 0) -> int:
+        """Write a whole batch of raw frames to the TAP
+
+        Parameters
+        ----------
+        frames: Iterable[bytes-like]
+            the bare Ethernet frames, in order
+
+        queue: int = 0
+            which of the device's queues to send them through
+
+        Returns
+        -------
+        int
+            how many frames were sent
+        """
+        # a TAP fd (or packet socket) takes exactly one frame per write,
+        # writev would just glue them all together into one, so it's a
+        # tight loop over the one (already open) fd, rather than scapy
+        if self.is_client:
+            write = self._client_sock().send
+        else:
+            fd = self.fds[queue]
+
+            def write(frame):
+                os.write(fd, frame)
+
+        n = 0
+        for frame in frames:
+            write(frame)
+            n += 1
+
+        self.tx_frames[queue] += n
+        return n
+
+    def recv_many(
+        self, max_n: int = 64, queue: int = 0, timeout: float = 0.0
+    ) -> list[memoryview]:
+        """Read up to `max_n` frames off the TAP, into preallocated buffers
+
+        Each frame is read (with `os.readv`) straight into its own slot
+        of a per-queue buffer pool, so there's no allocation per frame.
+        Don't mix this with `start_reader` on the same queue.
+
+        Parameters
+        ----------
+        max_n: int = 64
+            the most frames to read in one go
+
+        queue: int = 0
+            which of the device's queues to read from
+
+        timeout: float = 0.0
+            how long (in seconds) to wait for the first frame,
+            after that, only what's already there is read
+
+        Returns
+        -------
+        list[memoryview]
+            the frames, oldest first (may be empty);
+            these are views into the pool, so they're only good 'til the
+            next `recv_many` on this queue: copy anything you want to keep
+        """
+        if self.is_client:
+            raise UsageError("err (tap): a client instance may not listen")
+
+        fd = self.fds[queue]
+        os.set_blocking(fd, False)
+
+        pool = self._pool(queue, max_n)
+        slot_size = self._slot_size
+
+        if timeout:
+            select.select([fd], [], [], timeout)
+
+        frames = []
+        for k in range(max_n):
+            slot = memoryview(pool)[k*slot_size:(k+1)*slot_size]
+            try:
+                n = os.readv(fd, [slot])
+            except BlockingIOError:
+                break
+            frames.append(slot[:n])
+
+        self.rx_frames[queue] += len(frames)
+        return frames
+
+    def _pool(self, queue: int, max_n: int) -> bytearray:
+        """`queue`'s buffer pool, (re)allocated if it's too small"""
+        # sized off the MTU, which is cached (and kept fresh) by IPRoute
+        mtu = ipr.get_link_info(self.dev).mtu or 1500
+        slot_size = max(self._slot_size, mtu + FRAME_OVERHEAD)
+        if slot_size != self._slot_size:
+            self._slot_size = slot_size
+            self._pools = [None] * self.queues
+
+        pool = self._pools[queue]
+        if pool is None or len(pool) < max_n * slot_size:
+            pool = self._pools[queue] = bytearray(max_n * slot_size)
+
+        return pool
+
+    def _client_sock(self) -> socket.socket:
+        """a raw packet socket on the device, opened once then reused"""
+        if self._sock is None:
+            self._sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+            self._sock.bind((self.dev, 0))
+        return self._sock
+
+    def poll(
+        self, max_n: int | None = None, queue: int | None = None
+    ) -> list[Packet | bytes]:
+        """Grab whatever the background readers have queued up, without blocking
+
+        Parameters
+        ----------
+        max_n: int | None = None
+            The most frames to return in one go, or everything if None
+
+        queue: int | None = None
+            Just take frames from this queue, or from any of them if None
+
+        Returns
+        -------
+        list[Packet | bytes]
+            The received frames, oldest first (per queue; may be empty);
+            these are `bytes` if the reader was started in raw mode
+        """
+        packets = []
+        while max_n is None or len(packets) < max_n:
+            packet = self.recv_nowait(queue)
+            if packet is None:
+                break
+            packets.append(packet)
+
+        return packets
+
+    def recv_nowait(self, queue: int | None = None) -> Packet | bytes | None:
+        """Grab the oldest frame the background readers have queued up, if any
+
+        Parameters
+        ----------
+        queue: int | None = None
+            Just take it from this queue, or from any of them if None
+            (taking turns, so no queue gets starved)
+        """
+        if queue is not None:
+            return _get_nowait(self._rx_queues[queue])
+
+        for _ in range(self.queues):
+            q = self._next_queue
+            self._next_queue = (q + 1) % self.queues
+
+            packet = _get_nowait(self._rx_queues[q])
+            if packet is not None:
+                return packet
+
+        return None
+
+    def pending(self, queue: int | None = None) -> int:
+        """Approximately how many frames are waiting to be `poll`ed"""
+        if queue is not None:
+            return self._rx_queues[queue].qsize()
+        return sum(q.qsize() for q in self._rx_queues)
+
+    def send(self, packet: Packet, queue: int = 0):
         """
         Parameters
         ----------
         packet: Packet
             the packet you wish to send to the TAP interface
+
+        queue: int = 0
+            which queue to send it through, if it's a multi-queue device
         """
         if self.is_client:
-            sendp(packet, iface=self.dev)
+            # not `sendp`, that'd open (and close) a new socket every time
+            self.send_raw(bytes(packet))
+        elif self.tap is None:
+            self.send_raw(bytes(packet), queue)
         else:
             self.tap.send(packet)
+            self.tx_frames[0] += 1
 
     def send_recv1(self, packet: Packet, timeout:int = 500):
         """Send a packet and receive the first response
@@ -174,3 +555,23 @@ class Tap:
 
     async def _handle(self):
         pass
+
+
+def _get_nowait(q: queue.Queue):
+    try:
+        return q.get_nowait()
+    except queue.Empty:
+        return None
+
+
+def _open_tap(devname: str, flags: int) -> int:
+    """attach one more queue to (or create) a TAP device, with these flags"""
+    fd = os.open("/dev/net/tun", os.O_RDWR)
+    try:
+        ifreq = struct.pack("16sH22x", devname.encode(), flags)
+        fcntl.ioctl(fd, TUNSETIFF, ifreq)
+    except OSError:
+        os.close(fd)
+        raise
+
+    return fd
@@ -0,0 +1,187 @@
+"""
+Declarative network topologies, applied through one `IPRoute.batch()`
+
+Describe the namespaces, bridges, veth pairs and TAPs you want,
+then `apply` it (and `destroy` it, once you're done):
+
+```python
+topo = Topology.basic_net(taps=32)
+topo.apply()
+...
+topo.destroy()
+```
+
+Must be run as root (or with `cap_net_admin`), like the ip commands it runs.
+"""
+
+from dataclasses import dataclass, field
+from option import Result
+from subprocess import CompletedProcess
+
+from netlib.iproute import IPBatch, IPRoute
+
+
+@dataclass
+class Veth:
+    """A veth pair: `name` is the end that goes into `netns` (if any),
+    `peer` stays in the root namespace, optionally enslaved to a bridge"""
+    name: str
+    peer: str
+    netns: str | None = None
+    addr: str | None = None  # e.g. "10.0.0.2/24", for the `name` end
+    master: str | None = None  # bridge for the `peer` end
+
+
+@dataclass
+class TapDev:
+    """A persistent TAP device, in the root namespace
+
+    `netlib.tap.Tap(name, queues=...)` (so `TAPServer` too) attaches to it,
+    as long as it's `multi_queue` for more than one queue;
+    close those first, or `destroy` can't delete it
+    """
+    name: str
+    master: str | None = None
+    addr: str | None = None
+    multi_queue: bool = False
+
+
+@dataclass
+class Topology:
+    namespaces: list[str] = field(default_factory=list)
+    bridges: list[str] = field(default_factory=list)
+    veths: list[Veth] = field(default_factory=list)
+    taps: list[TapDev] = field(default_factory=list)
+
+    @classmethod
+    def basic_net(
+        cls, client_ip: str = "10.0.0.2/24", server_ip: str = "10.0.0.3/24",
+        taps: int = 0, tap_prefix: str = "tap"
+    ) -> "Topology":
+        """The `nsc - br0 - nss` topology from scripts/basic_net/setup.sh,
+        plus `taps` TAP devices (`{tap_prefix}{k}`) on the same bridge"""
+        return cls(
+            namespaces=["nsc", "nss"],
+            bridges=["br0"],
+            veths=[
+                Veth("veth-c", "veth-brc", "nsc", client_ip, "br0"),
+                Veth("veth-s", "veth-brs", "nss", server_ip, "br0"),
+            ],
+            taps=[TapDev(f"{tap_prefix}{k}", master="br0") for k in range(taps)],
+        )
+
+    def add_taps(
+        self, count: int, prefix: str = "tap", master: str | None = None,
+        multi_queue: bool = False
+    ) -> "Topology":
+        """tack on `count` more TAPs, named `{prefix}{k}`"""
+        start = sum(tap.name.startswith(prefix) for tap in self.taps)
+        self.taps += [
+            TapDev(f"{prefix}{k}", master=master, multi_queue=multi_queue)
+            for k in range(start, start + count)
+        ]
+        return self
+
+    def commands(self, batch: IPBatch) -> IPBatch:
+        """queue up everything needed to build this topology
+
+        Ordered so everything in the root namespace comes first,
+        then each namespace's own config, i.e. one `ip -batch` per namespace
+        """
+        for ns in self.namespaces:
+            batch.ip("netns add", ns)
+
+        for br in self.bridges:
+            batch.link("add", br, "type bridge")
+            batch.link("set", br, "up")
+
+        for veth in self.veths:
+            batch.link("add", veth.name, "type veth peer name", veth.peer)
+            if veth.netns is not None:
+                batch.link("set", veth.name, "netns", veth.netns)
+            if veth.master is not None:
+                batch.link("set", veth.peer, "master", veth.master)
+            batch.link("set", veth.peer, "up")
+
+        for tap in self.taps:
+            batch.ip(
+                "tuntap add dev", tap.name, "mode tap",
+                *(["multi_queue"] if tap.multi_queue else [])
+            )
+            if tap.master is not None:
+                batch.link("set", tap.name, "master", tap.master)
+            if tap.addr is not None:
+                batch.addr("add", tap.addr, "dev", tap.name)
+            batch.link("set", tap.name, "up")
+
+        # and now inside the namespaces
+        for veth in sorted(self.veths, key=lambda v: v.netns or ""):
+            if veth.addr is not None:
+                batch.addr("add", veth.addr, "dev", veth.name, netns=veth.netns)
+            batch.link("set", veth.name, "up", netns=veth.netns)
+
+        return batch
+
+    def apply(self, ipr: IPRoute | None = None, as_root: bool = False):
+        """build it all, in a handful of `ip -batch` runs
+
+        Raises
+        ------
+        RuntimeError
+            if any of it fails (whatever came before stays applied,
+            `destroy` can clean that up)
+        """
+        with (ipr or IPRoute()).batch(as_root=as_root) as batch:
+            self.commands(batch)
+
+    def destroy(
+        self, ipr: IPRoute | None = None, as_root: bool = False
+    ) -> Result[list[CompletedProcess[str]], str]:
+        """tear it all down again, carrying on past anything already gone
+
+        Returns
+        -------
+        Result
+            an Err if anything couldn't be deleted (e.g. it never existed),
+            though everything else will have been, regardless
+        """
+        batch = (ipr or IPRoute()).batch(as_root=as_root, force=True)
+
+        # deleting a namespace takes its veth ends (and so their peers)
+        for ns in self.namespaces:
+            batch.ip("netns del", ns)
+        for veth in self.veths:
+            if veth.netns is None:
+                batch.link("del", veth.name)
+        for tap in self.taps:
+            # (the flags have to match the device's, or the kernel says no)
+            batch.ip(
+                "tuntap del dev", tap.name, "mode tap",
+                *(["multi_queue"] if tap.multi_queue else [])
+            )
+        for br in self.bridges:
+            batch.link("del", br)
+
+        return batch.apply()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="builds (or tears down) the nsc - br0 - nss topology"
+    )
+    parser.add_argument("action", choices=["up", "down"])
+    parser.add_argument("--client-ip", default="10.0.0.2/24")
+    parser.add_argument("--server-ip", default="10.0.0.3/24")
+    parser.add_argument("--taps", type=int, default=0,
+                        help="how many TAPs to add to br0")
+    args = parser.parse_args()
+
+    topo = Topology.basic_net(args.client_ip, args.server_ip, taps=args.taps)
+    if args.action == "up":
+        topo.apply()
+    else:
+        out = topo.destroy()
+        if out.is_err:
+            print(out.unwrap_err())
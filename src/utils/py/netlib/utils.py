@@ -1,4 +1,10 @@
 from scapy.packet import Packet
+import zlib
+
+_ETH_P_IP = 0x0800
+_ETH_P_IPV6 = 0x86DD
+_ETH_P_8021Q = 0x8100
+_PORTED_PROTOS = (6, 17)  # TCP, UDP
 
 
 def get_packet_layers(packet: Packet):
@@ -15,3 +21,34 @@ def get_packet_layers(packet: Packet):
         yield layer
         counter += 1
 
+
+def flow_hash(frame: bytes) -> int:
+    """A cheap, stable hash of the flow a raw Ethernet frame belongs to
+
+    Hashes the IP addresses (plus the ports, for TCP/UDP) of IPv4/IPv6
+    frames, or the MAC addresses of anything else, so every frame of a
+    flow lands on the same queue. No scapy involved.
+    """
+    ethertype = int.from_bytes(frame[12:14], "big")
+    offset = 14
+    if ethertype == _ETH_P_8021Q:
+        ethertype = int.from_bytes(frame[16:18], "big")
+        offset = 18
+
+    if ethertype == _ETH_P_IP and len(frame) >= offset + 20:
+        ihl = (frame[offset] & 0x0f) * 4
+        proto = frame[offset+9]
+        key = frame[offset+12:offset+20]
+        # only the first fragment has the L4 header
+        fragment = int.from_bytes(frame[offset+6:offset+8], "big") & 0x1fff
+        if proto in _PORTED_PROTOS and not fragment:
+            key += frame[offset+ihl:offset+ihl+4]
+    elif ethertype == _ETH_P_IPV6 and len(frame) >= offset + 40:
+        proto = frame[offset+6]
+        key = frame[offset+8:offset+40]
+        if proto in _PORTED_PROTOS:
+            key += frame[offset+40:offset+44]
+    else:
+        key = frame[:12]
+
+    return zlib.crc32(key)